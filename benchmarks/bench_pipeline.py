@@ -0,0 +1,316 @@
+﻿from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+from typing import Any, Awaitable, Callable
+
+if __package__ is None or __package__ == "":
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_validator import percentile
+from benchmarks.synthetic import SyntheticEmojiPackProvider, make_corpus
+from bot.config import Settings
+from bot.handlers.export_link import do_export
+from bot.schemas.manifest import ManifestItem, TgsMeta
+from bot.services.manifest_builder import build_manifest, dump_manifest
+from bot.services.state_store import MemoryStateStore
+from bot.services.status_updater import StatusUpdater
+from bot.services.tgs_validator import validate_tgs
+from bot.services.validation_pool import ValidationPool
+from bot.services.zipper import ArchiveWriter
+from bot.utils.files import sha256_hex
+
+FORMATS = ("tgs", "json")
+
+
+class BenchBot:
+    def __init__(self) -> None:
+        self.edits = 0
+
+    async def edit_message_text(self, text: str, **kwargs: Any) -> None:
+        self.edits += 1
+
+
+class BenchMessage:
+    def __init__(self, bot: BenchBot, user_id: int) -> None:
+        self.bot = bot
+        self.message_id = user_id
+        self.from_user = SimpleNamespace(id=user_id)
+        self.chat = SimpleNamespace(id=user_id)
+        self.documents = 0
+        self.archive_bytes = 0
+
+    async def answer(self, text: str, **kwargs: Any) -> SimpleNamespace:
+        return SimpleNamespace(message_id=self.message_id, chat=self.chat)
+
+    async def answer_document(self, document: Any, **kwargs: Any) -> SimpleNamespace:
+        self.documents += 1
+        if isinstance(document, str):
+            size = 0
+        elif getattr(document, "data", None) is not None:
+            size = len(document.data)
+        else:
+            size = os.path.getsize(document.path)
+        self.archive_bytes += size
+        file_id = f"bench:{self.message_id}:{self.documents}"
+        return SimpleNamespace(document=SimpleNamespace(file_id=file_id))
+
+
+def process_peak_rss_bytes() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def row(
+    stage: str,
+    export_format: str | None,
+    items: int,
+    cpu_s: float,
+    wall_s: float,
+    latencies: list[float] | None = None,
+) -> dict:
+    result = {
+        "stage": stage,
+        "format": export_format,
+        "items": items,
+        "cpu_s": round(cpu_s, 4),
+        "wall_s": round(wall_s, 4),
+        "items_per_s": round(items / wall_s, 1) if wall_s else 0.0,
+        "process_peak_rss_bytes": process_peak_rss_bytes(),
+    }
+    if latencies:
+        result["p50_s"] = round(percentile(latencies, 50), 5)
+        result["p95_s"] = round(percentile(latencies, 95), 5)
+    return result
+
+
+def bench_validate(corpus: list[bytes], export_format: str, config: Settings) -> dict:
+    strict = config.tgs_validation_mode == "strict" or export_format == "json"
+    latencies: list[float] = []
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    for data in corpus:
+        started = time.perf_counter()
+        validate_tgs(data, strict=strict)
+        latencies.append(time.perf_counter() - started)
+    return row(
+        "validate_tgs",
+        export_format,
+        len(corpus),
+        time.process_time() - cpu_start,
+        time.perf_counter() - wall_start,
+        latencies,
+    )
+
+
+def manifest_items(corpus: list[bytes], export_format: str) -> list[ManifestItem]:
+    mime = "application/json" if export_format == "json" else "application/x-tgsticker"
+    return [
+        ManifestItem(
+            index=index,
+            custom_emoji_id=str(index),
+            file_name=f"assets/{index:04d}.{export_format}",
+            mime=mime,
+            sha256=sha256_hex(data),
+            tgs_meta=TgsMeta(w=512, h=512, fr=60, ip=0, op=180),
+        )
+        for index, data in enumerate(corpus)
+    ]
+
+
+def bench_manifest(corpus: list[bytes], export_format: str) -> dict:
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    manifest = build_manifest(
+        source_url="https://t.me/addemoji/bench",
+        source_pack_name="bench",
+        pack_title="Bench",
+        pack_short_name="bench",
+        items=manifest_items(corpus, export_format),
+    )
+    dump_manifest(manifest)
+    return row(
+        "build_manifest",
+        export_format,
+        len(corpus),
+        time.process_time() - cpu_start,
+        time.perf_counter() - wall_start,
+    )
+
+
+def bench_archive(corpus: list[bytes], export_format: str, config: Settings) -> dict:
+    if export_format == "json":
+        payloads = [validate_tgs(data, strict=True).json_bytes for data in corpus]
+    else:
+        payloads = corpus
+    manifest_bytes = dump_manifest(
+        build_manifest(
+            source_url="https://t.me/addemoji/bench",
+            source_pack_name="bench",
+            pack_title="Bench",
+            pack_short_name="bench",
+            items=manifest_items(corpus, export_format),
+        )
+    ).encode("utf-8")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cpu_start, wall_start = time.process_time(), time.perf_counter()
+        with ArchiveWriter(
+            os.path.join(tmpdir, "bench.zip"),
+            max_memory_bytes=config.archive_spool_mb * 1024 * 1024,
+            deflate_level=config.archive_deflate_level,
+        ) as archive:
+            for index, payload in enumerate(payloads):
+                archive.add(f"assets/{index:04d}.{export_format}", payload)
+            archive.add("manifest.json", manifest_bytes)
+        return row(
+            "archive_writer",
+            export_format,
+            len(corpus),
+            time.process_time() - cpu_start,
+            time.perf_counter() - wall_start,
+        )
+
+
+async def bench_do_export(
+    provider: SyntheticEmojiPackProvider,
+    config: Settings,
+    export_format: str,
+    *,
+    jobs: int,
+    validation: str,
+) -> dict:
+    bot = BenchBot()
+    store = MemoryStateStore(max_users=jobs + 1, ttl_s=0)
+    updater = StatusUpdater(bot, global_rate=1000, chat_rate=1000, chat_burst=1000, min_interval_s=0)
+    validator = ValidationPool(mode=validation, strict=config.tgs_validation_mode == "strict")
+    latencies: list[float] = []
+    messages: list[BenchMessage] = []
+
+    async def job(user_id: int) -> None:
+        message = BenchMessage(bot, user_id)
+        messages.append(message)
+        store.update(user_id, menu_message_id=user_id, menu_chat_id=user_id, awaiting=True)
+        pack = await provider.get_pack(f"bench_{export_format}_{user_id}")
+        started = time.perf_counter()
+        await do_export(
+            message=message,
+            config=config,
+            provider=provider,
+            ui_store=store,
+            items=pack.items,
+            source_url=f"https://t.me/addemoji/{pack.short_name}",
+            source_pack_name=pack.short_name,
+            pack_title=pack.title,
+            pack_short_name=pack.short_name,
+            export_name=pack.short_name,
+            export_format=export_format,
+            validator=validator,
+            status_updater=updater,
+        )
+        latencies.append(time.perf_counter() - started)
+
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    try:
+        await asyncio.gather(*(job(user_id) for user_id in range(1, jobs + 1)))
+    finally:
+        await validator.close()
+        await updater.close()
+    result = row(
+        "do_export",
+        export_format,
+        provider.pack_size * jobs,
+        time.process_time() - cpu_start,
+        time.perf_counter() - wall_start,
+        latencies,
+    )
+    result["jobs"] = jobs
+    result["delivered"] = sum(message.documents for message in messages)
+    result["archive_bytes"] = sum(message.archive_bytes for message in messages)
+    result["status_edits"] = bot.edits
+    return result
+
+
+def run_stage(fn: Callable[[], dict] | Callable[[], Awaitable[dict]]) -> dict:
+    result = fn()
+    if asyncio.iscoroutine(result):
+        result = asyncio.run(result)
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline throughput of the export pipeline")
+    parser.add_argument("--items", type=int, default=100, help="emojis per pack")
+    parser.add_argument("--jobs", type=int, default=4, help="concurrent do_export jobs")
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--jitter-ms", type=float, default=20.0)
+    parser.add_argument("--validation", choices=("inline", "thread", "process"), default="inline")
+    parser.add_argument(
+        "--tgs-validation", choices=("fast", "strict"), help="defaults to TGS_VALIDATION_MODE"
+    )
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=list(FORMATS))
+    parser.add_argument("--output", help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.items)
+    provider = SyntheticEmojiPackProvider(
+        corpus,
+        pack_size=args.items,
+        latency_s=args.latency_ms / 1000,
+        jitter_s=args.jitter_ms / 1000,
+    )
+    overrides = {"TGS_VALIDATION_MODE": args.tgs_validation} if args.tgs_validation else {}
+    config = Settings(
+        BOT_TOKEN="0:bench",
+        MAX_EMOJIS_PER_PACK=max(args.items, 1),
+        EXPORT_WORKERS=args.jobs,
+        **overrides,
+    )
+
+    results = []
+    for export_format in args.formats:
+        results.append(run_stage(lambda: bench_validate(corpus, export_format, config)))
+        results.append(run_stage(lambda: bench_manifest(corpus, export_format)))
+        results.append(run_stage(lambda: bench_archive(corpus, export_format, config)))
+        results.append(
+            run_stage(
+                lambda: bench_do_export(
+                    provider, config, export_format, jobs=args.jobs, validation=args.validation
+                )
+            )
+        )
+
+    for entry in results:
+        latency = (
+            f" p50={entry['p50_s'] * 1000:.1f}ms p95={entry['p95_s'] * 1000:.1f}ms"
+            if "p50_s" in entry
+            else ""
+        )
+        print(
+            f"{entry['format']:>4} {entry['stage']:<15} {entry['items_per_s']:>9.1f} items/s "
+            f"cpu={entry['cpu_s']:.3f}s wall={entry['wall_s']:.3f}s{latency} "
+            f"process_peak_rss={entry['process_peak_rss_bytes'] / 1024 / 1024:.0f} MiB"
+        )
+
+    if args.output:
+        report = {
+            "config": {
+                "items": args.items,
+                "jobs": args.jobs,
+                "latency_ms": args.latency_ms,
+                "jitter_ms": args.jitter_ms,
+                "validation": args.validation,
+                "tgs_validation": config.tgs_validation_mode,
+            },
+            "results": results,
+        }
+        with open(args.output, "w", encoding="utf-8") as file_handle:
+            json.dump(report, file_handle, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+﻿from __future__ import annotations
+
+import argparse
+import gzip
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+if __package__ is None or __package__ == "":
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import make_corpus
+from bot.services.tgs_validator import TgsValidationError, validate_tgs
+
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_mode(corpus: list[bytes], *, strict: bool, repeat: int) -> dict:
+    latencies: list[float] = []
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    for _ in range(repeat):
+        for data in corpus:
+            started = time.perf_counter()
+            validate_tgs(data, strict=strict)
+            latencies.append(time.perf_counter() - started)
+    wall_s = time.perf_counter() - wall_start
+    cpu_s = time.process_time() - cpu_start
+
+    tracemalloc.start()
+    for data in corpus:
+        validate_tgs(data, strict=strict)
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "mode": "strict" if strict else "fast",
+        "items": len(latencies),
+        "items_per_s": round(len(latencies) / wall_s, 1),
+        "cpu_s": round(cpu_s, 4),
+        "p50_ms": round(statistics.median(latencies) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "peak_alloc_kib": round(peak_bytes / 1024, 1),
+    }
+
+
+def run_bomb(size_mb: int) -> dict:
+    bomb = gzip.compress(b"\0" * (size_mb * 1024 * 1024))
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        validate_tgs(bomb)
+        rejected = False
+    except TgsValidationError:
+        rejected = True
+    elapsed = time.perf_counter() - started
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "mode": "bomb",
+        "compressed_kib": round(len(bomb) / 1024, 1),
+        "decompressed_mb": size_mb,
+        "rejected": rejected,
+        "elapsed_ms": round(elapsed * 1000, 3),
+        "peak_alloc_kib": round(peak_bytes / 1024, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="validate_tgs throughput in fast and strict mode")
+    parser.add_argument("--items", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--size", type=int, default=120_000, help="mean decompressed Lottie size")
+    parser.add_argument("--bomb-mb", type=int, default=256)
+    parser.add_argument("--output", help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.items, target_bytes=args.size)
+    results = [run_mode(corpus, strict=False, repeat=args.repeat)]
+    results.append(run_mode(corpus, strict=True, repeat=args.repeat))
+    results.append(run_bomb(args.bomb_mb))
+
+    for row in results:
+        print(json.dumps(row, ensure_ascii=False))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file_handle:
+            json.dump(results, file_handle, indent=2)
+
+
+if __name__ == "__main__":
+    main()
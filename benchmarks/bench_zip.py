@@ -0,0 +1,104 @@
+﻿from __future__ import annotations
+
+import argparse
+import gzip
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from zipfile import ZIP_DEFLATED, ZipFile
+
+if __package__ is None or __package__ == "":
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import make_corpus
+from bot.services.zipper import ArchiveWriter
+
+
+def payloads_for(corpus: list[bytes], export_format: str) -> list[tuple[str, bytes]]:
+    if export_format == "json":
+        return [(f"assets/{i:04d}.json", gzip.decompress(data)) for i, data in enumerate(corpus)]
+    return [(f"assets/{i:04d}.tgs", data) for i, data in enumerate(corpus)]
+
+
+def zip_deflate_all(entries: list[tuple[str, bytes]], manifest: bytes) -> int:
+    buffer = io.BytesIO()
+    with ZipFile(buffer, mode="w", compression=ZIP_DEFLATED) as zf:
+        zf.writestr("manifest.json", manifest)
+        for arcname, data in entries:
+            zf.writestr(arcname, data)
+    return len(buffer.getvalue())
+
+
+def zip_per_entry(entries: list[tuple[str, bytes]], manifest: bytes, level: int) -> int:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with ArchiveWriter(
+            os.path.join(tmpdir, "bench.zip"), max_memory_bytes=1 << 30, deflate_level=level
+        ) as archive:
+            for arcname, data in entries:
+                archive.add(arcname, data)
+            archive.add("manifest.json", manifest)
+            archive.close()
+            return len(archive.getvalue())
+
+
+def measure(fn, repeat: int) -> tuple[float, float, int]:
+    best_cpu = best_wall = float("inf")
+    size = 0
+    for _ in range(repeat):
+        cpu_start, wall_start = time.process_time(), time.perf_counter()
+        size = fn()
+        best_cpu = min(best_cpu, time.process_time() - cpu_start)
+        best_wall = min(best_wall, time.perf_counter() - wall_start)
+    return best_cpu, best_wall, size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Archive CPU time and size per compression policy")
+    parser.add_argument("--items", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--level", type=int, default=6)
+    parser.add_argument("--output", help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.items)
+    manifest = json.dumps({"items": list(range(args.items))}, indent=2).encode("utf-8")
+
+    results = []
+    for export_format in ("tgs", "json"):
+        entries = payloads_for(corpus, export_format)
+        raw_bytes = sum(len(data) for _, data in entries)
+        policies = {
+            "deflate_all": lambda: zip_deflate_all(entries, manifest),
+            "per_entry": lambda: zip_per_entry(entries, manifest, args.level),
+        }
+        for policy, fn in policies.items():
+            cpu_s, wall_s, size = measure(fn, args.repeat)
+            results.append(
+                {
+                    "format": export_format,
+                    "policy": policy,
+                    "items": args.items,
+                    "payload_bytes": raw_bytes,
+                    "archive_bytes": size,
+                    "cpu_s": round(cpu_s, 4),
+                    "wall_s": round(wall_s, 4),
+                }
+            )
+
+    for row in results:
+        print(
+            f"{row['format']:>4} {row['policy']:<12} cpu={row['cpu_s']:.3f}s "
+            f"wall={row['wall_s']:.3f}s size={row['archive_bytes'] / 1024:.0f} KiB "
+            f"(payload {row['payload_bytes'] / 1024:.0f} KiB)"
+        )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file_handle:
+            json.dump(results, file_handle, indent=2)
+
+
+if __name__ == "__main__":
+    main()
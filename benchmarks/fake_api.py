@@ -0,0 +1,404 @@
+﻿from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from dataclasses import asdict, dataclass, field, fields
+from typing import Any
+
+from aiohttp import web
+
+if __package__ is None or __package__ == "":
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_validator import percentile
+from benchmarks.synthetic import make_corpus
+
+UNFAULTED_METHODS = {"getupdates", "getme", "answercallbackquery"}
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"}
+
+
+@dataclass
+class FaultConfig:
+    latency_s: float = 0.0
+    jitter_s: float = 0.0
+    rate_limit_ratio: float = 0.0
+    retry_after: int = 1
+    timeout_ratio: float = 0.0
+    timeout_s: float = 60.0
+    corrupt_ratio: float = 0.0
+
+    def update(self, changes: dict[str, Any]) -> None:
+        names = {item.name for item in fields(self)}
+        for key, value in changes.items():
+            if key in names:
+                setattr(self, key, type(getattr(self, key))(value))
+
+
+@dataclass
+class _Scenario:
+    chat_id: int
+    pack_name: str
+    export_format: str
+    state: str = "start"
+    started_at: float = field(default_factory=time.perf_counter)
+    export_started_at: float | None = None
+    documents: int = 0
+
+
+class FakeBotApi:
+    def __init__(
+        self,
+        *,
+        faults: FaultConfig | None = None,
+        pack_size: int = 50,
+        corpus_size: int = 64,
+        seed: int = 0,
+    ) -> None:
+        self.faults = faults or FaultConfig()
+        self.pack_size = pack_size
+        self.corpus = make_corpus(corpus_size, seed=seed)
+        self.requests: dict[str, int] = {}
+        self.injected: dict[str, int] = {"rate_limited": 0, "timeouts": 0, "corrupt": 0}
+        self.uploaded_bytes = 0
+        self.completed: list[float] = []
+        self.failed: list[float] = []
+        self._rng = random.Random(seed)
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1000)
+        self._document_ids = itertools.count(1)
+        self._updates: list[dict[str, Any]] = []
+        self._updates_changed = asyncio.Event()
+        self._scenarios: dict[int, _Scenario] = {}
+        self._callbacks: dict[str, int] = {}
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self.handle_method)
+        app.router.add_get("/bot{token}/{method}", self.handle_method)
+        app.router.add_get("/file/bot{token}/{path:.+}", self.handle_file)
+        app.router.add_post("/_control/scenario", self.handle_scenario)
+        app.router.add_post("/_control/faults", self.handle_faults)
+        app.router.add_get("/_control/stats", self.handle_stats)
+        return app
+
+    def _count(self, name: str) -> None:
+        self.requests[name] = self.requests.get(name, 0) + 1
+
+    async def _inject(self, method: str) -> web.Response | None:
+        faults = self.faults
+        delay = faults.latency_s + self._rng.uniform(0, faults.jitter_s)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self._rng.random() < faults.timeout_ratio:
+            self.injected["timeouts"] += 1
+            await asyncio.sleep(faults.timeout_s)
+        if self._rng.random() < faults.rate_limit_ratio:
+            self.injected["rate_limited"] += 1
+            return web.json_response(
+                {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": f"Too Many Requests: retry after {faults.retry_after}",
+                    "parameters": {"retry_after": faults.retry_after},
+                },
+                status=429,
+            )
+        return None
+
+    async def handle_method(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        key = method.lower()
+        self._count(method)
+        params = await self._params(request)
+
+        if key not in UNFAULTED_METHODS:
+            injected = await self._inject(key)
+            if injected is not None:
+                return injected
+
+        handler = getattr(self, f"api_{key}", None)
+        if handler is None:
+            return self._ok(True)
+        try:
+            result = await handler(params)
+        except LookupError as exc:
+            return web.json_response(
+                {"ok": False, "error_code": 400, "description": f"Bad Request: {exc}"},
+                status=400,
+            )
+        return self._ok(result)
+
+    async def handle_file(self, request: web.Request) -> web.Response:
+        self._count("file")
+        injected = await self._inject("file")
+        if injected is not None:
+            return injected
+        path = request.match_info["path"]
+        try:
+            data = self.corpus[int(path.rsplit("/", 1)[-1].split(".", 1)[0])]
+        except (ValueError, IndexError):
+            raise web.HTTPNotFound()
+        if self._rng.random() < self.faults.corrupt_ratio:
+            self.injected["corrupt"] += 1
+            data = data[: len(data) // 2]
+        return web.Response(body=data, content_type="application/octet-stream")
+
+    async def _params(self, request: web.Request) -> dict[str, Any]:
+        if request.method == "GET":
+            raw: dict[str, Any] = dict(request.query)
+        elif request.content_type == "application/json":
+            raw = await request.json()
+        else:
+            raw = {}
+            for name, value in (await request.post()).items():
+                if isinstance(value, web.FileField):
+                    size = len(value.file.read())
+                    raw[name] = {"file_name": value.filename, "size": size}
+                else:
+                    raw[name] = value
+        params: dict[str, Any] = {}
+        for name, value in raw.items():
+            if isinstance(value, str) and value[:1] in "[{":
+                try:
+                    value = json.loads(value)
+                except ValueError:
+                    pass
+            params[name] = value
+        return params
+
+    @staticmethod
+    def _ok(result: Any) -> web.Response:
+        return web.json_response({"ok": True, "result": result})
+
+    def _message(self, chat_id: int, **extra: Any) -> dict[str, Any]:
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            **extra,
+        }
+
+    def _sticker(self, pack_name: str, index: int) -> dict[str, Any]:
+        corpus_index = index % len(self.corpus)
+        return {
+            "file_id": f"{pack_name}.{index}.{corpus_index}",
+            "file_unique_id": f"{pack_name}-{index}",
+            "type": "custom_emoji",
+            "width": 100,
+            "height": 100,
+            "is_animated": True,
+            "is_video": False,
+            "custom_emoji_id": f"{abs(hash(pack_name)) % 10**9}{index:05d}",
+            "file_size": len(self.corpus[corpus_index]),
+        }
+
+    def _push(self, **payload: Any) -> None:
+        self._updates.append({"update_id": next(self._update_ids), **payload})
+        self._updates_changed.set()
+
+    def _user_message(self, chat_id: int, text: str) -> dict[str, Any]:
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": f"user{chat_id}"},
+            "text": text,
+        }
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text)}]
+        return message
+
+    async def api_getme(self, params: dict[str, Any]) -> dict[str, Any]:
+        return BOT_USER
+
+    async def api_getupdates(self, params: dict[str, Any]) -> list[dict[str, Any]]:
+        offset = int(params.get("offset") or 0)
+        timeout = min(float(params.get("timeout") or 0), 30.0)
+        self._updates = [update for update in self._updates if update["update_id"] >= offset]
+        if not self._updates and timeout > 0:
+            self._updates_changed.clear()
+            try:
+                await asyncio.wait_for(self._updates_changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        limit = int(params.get("limit") or 100)
+        return self._updates[:limit]
+
+    async def api_getstickerset(self, params: dict[str, Any]) -> dict[str, Any]:
+        name = str(params["name"])
+        return {
+            "name": name,
+            "title": f"Fake {name}",
+            "sticker_type": "custom_emoji",
+            "stickers": [self._sticker(name, index) for index in range(self.pack_size)],
+        }
+
+    async def api_getcustomemojistickers(self, params: dict[str, Any]) -> list[dict[str, Any]]:
+        stickers = []
+        for custom_id in params.get("custom_emoji_ids") or []:
+            sticker = self._sticker("message", int(str(custom_id)[-5:]))
+            sticker["custom_emoji_id"] = str(custom_id)
+            stickers.append(sticker)
+        return stickers
+
+    async def api_getfile(self, params: dict[str, Any]) -> dict[str, Any]:
+        file_id = str(params["file_id"])
+        corpus_index = int(file_id.rsplit(".", 1)[-1])
+        return {
+            "file_id": file_id,
+            "file_unique_id": file_id.replace(".", "-"),
+            "file_size": len(self.corpus[corpus_index]),
+            "file_path": f"stickers/{corpus_index}.tgs",
+        }
+
+    async def api_sendmessage(self, params: dict[str, Any]) -> dict[str, Any]:
+        chat_id = int(params["chat_id"])
+        message = self._message(chat_id, text=str(params.get("text", "")))
+        scenario = self._scenarios.get(chat_id)
+        if scenario is not None and scenario.state == "start":
+            callback_id = f"cb{message['message_id']}"
+            self._callbacks[callback_id] = chat_id
+            scenario.state = "format"
+            self._push(
+                callback_query={
+                    "id": callback_id,
+                    "from": {"id": chat_id, "is_bot": False, "first_name": f"user{chat_id}"},
+                    "chat_instance": str(chat_id),
+                    "data": f"fmt:{scenario.export_format}",
+                    "message": message,
+                }
+            )
+        return message
+
+    async def api_answercallbackquery(self, params: dict[str, Any]) -> bool:
+        chat_id = self._callbacks.pop(str(params.get("callback_query_id")), None)
+        scenario = self._scenarios.get(chat_id) if chat_id is not None else None
+        if scenario is not None and scenario.state == "format":
+            scenario.state = "export"
+            scenario.export_started_at = time.perf_counter()
+            self._push(
+                message=self._user_message(chat_id, f"https://t.me/addemoji/{scenario.pack_name}")
+            )
+        return True
+
+    async def api_editmessagetext(self, params: dict[str, Any]) -> dict[str, Any]:
+        chat_id = int(params.get("chat_id") or 0)
+        text = str(params.get("text", ""))
+        scenario = self._scenarios.get(chat_id)
+        if scenario is not None and scenario.state == "export":
+            if text.startswith("готово"):
+                self._finish(scenario, self.completed)
+            elif text.startswith("экспорт прерван"):
+                self._finish(scenario, self.failed)
+        return self._message(chat_id, text=text)
+
+    async def api_senddocument(self, params: dict[str, Any]) -> dict[str, Any]:
+        chat_id = int(params["chat_id"])
+        document = params.get("document")
+        if isinstance(document, dict):
+            self.uploaded_bytes += document["size"]
+            file_name, size = document["file_name"], document["size"]
+        else:
+            file_name, size = "cached.zip", 0
+        scenario = self._scenarios.get(chat_id)
+        if scenario is not None:
+            scenario.documents += 1
+        document_id = next(self._document_ids)
+        return self._message(
+            chat_id,
+            document={
+                "file_id": f"doc{document_id}",
+                "file_unique_id": f"udoc{document_id}",
+                "file_name": file_name,
+                "file_size": size,
+            },
+        )
+
+    def _finish(self, scenario: _Scenario, bucket: list[float]) -> None:
+        scenario.state = "done"
+        started = scenario.export_started_at or scenario.started_at
+        bucket.append(time.perf_counter() - started)
+
+    async def handle_scenario(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        users = int(body.get("users", 1))
+        packs = max(1, int(body.get("packs", 1)))
+        export_format = str(body.get("format", "tgs"))
+        first_chat = int(body.get("first_chat_id", 10_000 + len(self._scenarios)))
+        for offset in range(users):
+            chat_id = first_chat + offset
+            self._scenarios[chat_id] = _Scenario(
+                chat_id=chat_id,
+                pack_name=f"fakepack{offset % packs}",
+                export_format=export_format,
+            )
+            self._push(message=self._user_message(chat_id, "/start"))
+        return web.json_response({"ok": True, "users": users, "first_chat_id": first_chat})
+
+    async def handle_faults(self, request: web.Request) -> web.Response:
+        self.faults.update(await request.json())
+        return web.json_response({"ok": True, "faults": asdict(self.faults)})
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats())
+
+    def stats(self) -> dict[str, Any]:
+        states: dict[str, int] = {}
+        for scenario in self._scenarios.values():
+            states[scenario.state] = states.get(scenario.state, 0) + 1
+        latencies = self.completed
+        return {
+            "requests": self.requests,
+            "injected": self.injected,
+            "uploaded_bytes": self.uploaded_bytes,
+            "users": len(self._scenarios),
+            "states": states,
+            "completed": len(self.completed),
+            "failed": len(self.failed),
+            "pending_updates": len(self._updates),
+            "p50_s": round(percentile(latencies, 50), 4) if latencies else None,
+            "p95_s": round(percentile(latencies, 95), 4) if latencies else None,
+            "faults": asdict(self.faults),
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fake Telegram Bot API for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--pack-size", type=int, default=50)
+    parser.add_argument("--corpus", type=int, default=64)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="share of 429 responses")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="share of hung requests")
+    parser.add_argument("--timeout-s", type=float, default=60.0)
+    parser.add_argument("--corrupt-rate", type=float, default=0.0, help="share of broken files")
+    args = parser.parse_args()
+
+    api = FakeBotApi(
+        faults=FaultConfig(
+            latency_s=args.latency_ms / 1000,
+            jitter_s=args.jitter_ms / 1000,
+            rate_limit_ratio=args.rate_limit,
+            retry_after=args.retry_after,
+            timeout_ratio=args.timeout_rate,
+            timeout_s=args.timeout_s,
+            corrupt_ratio=args.corrupt_rate,
+        ),
+        pack_size=args.pack_size,
+        corpus_size=args.corpus,
+    )
+    web.run_app(api.app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+﻿from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+import aiohttp
+
+if __package__ is None or __package__ == "":
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def spawn_bot(api_base: str, token: str) -> subprocess.Popen:
+    env = {**os.environ, "BOT_TOKEN": token, "TELEGRAM_API_BASE": api_base}
+    return subprocess.Popen([sys.executable, os.path.join(REPO_ROOT, "bot", "main.py")], env=env)
+
+
+async def run(args: argparse.Namespace) -> dict:
+    async with aiohttp.ClientSession(base_url=args.api) as session:
+        if args.faults:
+            async with session.post("/_control/faults", json=json.loads(args.faults)) as resp:
+                resp.raise_for_status()
+
+        async with session.get("/_control/stats") as resp:
+            baseline = await resp.json()
+        first_chat = 10_000 + baseline["users"]
+
+        started = time.perf_counter()
+        batches = max(1, args.ramp_batches)
+        per_batch = -(-args.users // batches)
+        sent = 0
+        for batch in range(batches):
+            users = min(per_batch, args.users - sent)
+            if users <= 0:
+                break
+            payload = {
+                "users": users,
+                "packs": args.packs,
+                "format": args.format,
+                "first_chat_id": first_chat + sent,
+            }
+            async with session.post("/_control/scenario", json=payload) as resp:
+                resp.raise_for_status()
+            sent += users
+            if batch + 1 < batches:
+                await asyncio.sleep(args.ramp_s / batches)
+
+        target_done = baseline["completed"] + baseline["failed"] + args.users
+        stats = baseline
+        while time.perf_counter() - started < args.timeout_s:
+            await asyncio.sleep(1.0)
+            async with session.get("/_control/stats") as resp:
+                stats = await resp.json()
+            done = stats["completed"] + stats["failed"]
+            print(
+                f"{time.perf_counter() - started:6.1f}s done={done - target_done + args.users}"
+                f"/{args.users} failed={stats['failed'] - baseline['failed']} "
+                f"p95={stats['p95_s']}",
+                flush=True,
+            )
+            if done >= target_done:
+                break
+
+    wall_s = time.perf_counter() - started
+    completed = stats["completed"] - baseline["completed"]
+    return {
+        "users": args.users,
+        "packs": args.packs,
+        "format": args.format,
+        "wall_s": round(wall_s, 2),
+        "completed": completed,
+        "failed": stats["failed"] - baseline["failed"],
+        "jobs_per_s": round(completed / wall_s, 2) if wall_s else 0.0,
+        "p50_s": stats["p50_s"],
+        "p95_s": stats["p95_s"],
+        "server": stats,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Drive simulated users against the fake Bot API")
+    parser.add_argument("--api", default="http://127.0.0.1:8081")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--packs", type=int, default=10, help="distinct packs requested")
+    parser.add_argument("--format", choices=("tgs", "json"), default="tgs")
+    parser.add_argument("--ramp-s", type=float, default=0.0)
+    parser.add_argument("--ramp-batches", type=int, default=1)
+    parser.add_argument("--timeout-s", type=float, default=600.0)
+    parser.add_argument("--faults", help='JSON fault overrides, e.g. {"rate_limit_ratio": 0.05}')
+    parser.add_argument("--spawn-bot", action="store_true", help="start bot/main.py against --api")
+    parser.add_argument("--token", default="123456:LOADTEST")
+    parser.add_argument("--output", help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    bot_process = spawn_bot(args.api, args.token) if args.spawn_bot else None
+    try:
+        if bot_process is not None:
+            time.sleep(2.0)
+        result = asyncio.run(run(args))
+    finally:
+        if bot_process is not None:
+            bot_process.terminate()
+            bot_process.wait(timeout=30)
+
+    print(
+        f"{result['completed']}/{result['users']} completed, {result['failed']} failed, "
+        f"{result['jobs_per_s']} jobs/s, p50={result['p50_s']}s p95={result['p95_s']}s"
+    )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file_handle:
+            json.dump(result, file_handle, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+﻿from __future__ import annotations
+
+import asyncio
+import gzip
+import json
+import random
+
+from bot.services.provider_base import (
+    CustomEmojiResolution,
+    EmojiItem,
+    EmojiPack,
+    EmojiPackProvider,
+    ProviderError,
+)
+
+
+def _keyframes(rng: random.Random, frames: int, dims: int) -> list[dict]:
+    result = []
+    for t in range(0, frames, max(1, frames // 8)):
+        result.append(
+            {
+                "t": t,
+                "s": [round(rng.uniform(-256, 256), 3) for _ in range(dims)],
+                "i": {"x": [0.833], "y": [0.833]},
+                "o": {"x": [0.167], "y": [0.167]},
+            }
+        )
+    return result
+
+
+def _shape(rng: random.Random, vertices: int) -> dict:
+    def points() -> list[list[float]]:
+        return [[round(rng.uniform(-256, 256), 3), round(rng.uniform(-256, 256), 3)] for _ in range(vertices)]
+
+    return {
+        "ty": "gr",
+        "it": [
+            {"ty": "sh", "ks": {"a": 0, "k": {"i": points(), "o": points(), "v": points(), "c": True}}},
+            {"ty": "fl", "c": {"a": 0, "k": [rng.random(), rng.random(), rng.random(), 1]}, "o": {"a": 0, "k": 100}},
+            {"ty": "tr", "p": {"a": 0, "k": [0, 0]}, "a": {"a": 0, "k": [0, 0]}, "s": {"a": 0, "k": [100, 100]}},
+        ],
+    }
+
+
+def make_lottie(seed: int, *, target_bytes: int = 120_000, frames: int = 180) -> dict:
+    rng = random.Random(seed)
+    doc: dict = {
+        "v": "5.5.2",
+        "fr": 60,
+        "ip": 0,
+        "op": frames,
+        "w": 512,
+        "h": 512,
+        "nm": f"synthetic_{seed}",
+        "ddd": 0,
+        "assets": [],
+        "layers": [],
+    }
+    size = len(json.dumps(doc))
+    index = 0
+    while size < target_bytes:
+        layer = {
+            "ddd": 0,
+            "ind": index,
+            "ty": 4,
+            "nm": f"layer_{index}",
+            "ks": {
+                "o": {"a": 0, "k": 100},
+                "r": {"a": 1, "k": _keyframes(rng, frames, 1)},
+                "p": {"a": 1, "k": _keyframes(rng, frames, 3)},
+                "s": {"a": 1, "k": _keyframes(rng, frames, 3)},
+            },
+            "shapes": [_shape(rng, rng.randint(4, 24)) for _ in range(rng.randint(1, 4))],
+            "ip": 0,
+            "op": frames,
+            "st": 0,
+        }
+        doc["layers"].append(layer)
+        size += len(json.dumps(layer)) + 1
+        index += 1
+    return doc
+
+
+def make_tgs(seed: int, *, target_bytes: int = 120_000) -> bytes:
+    raw = json.dumps(make_lottie(seed, target_bytes=target_bytes), separators=(",", ":"))
+    return gzip.compress(raw.encode("utf-8"))
+
+
+def make_corpus(count: int, *, target_bytes: int = 120_000, seed: int = 0) -> list[bytes]:
+    rng = random.Random(seed)
+    return [
+        make_tgs(seed * 100_000 + index, target_bytes=int(target_bytes * rng.uniform(0.4, 1.6)))
+        for index in range(count)
+    ]
+
+
+class SyntheticEmojiPackProvider(EmojiPackProvider):
+    def __init__(
+        self,
+        corpus: list[bytes],
+        *,
+        pack_size: int,
+        latency_s: float = 0.0,
+        jitter_s: float = 0.0,
+        seed: int = 0,
+    ) -> None:
+        self.corpus = corpus
+        self.pack_size = pack_size
+        self.latency_s = latency_s
+        self.jitter_s = jitter_s
+        self.downloads = 0
+        self._rng = random.Random(seed)
+
+    def _item(self, pack_name: str, index: int) -> EmojiItem:
+        data = self.corpus[index % len(self.corpus)]
+        return EmojiItem(
+            custom_emoji_id=f"{pack_name}:{index}",
+            file_id=str(index % len(self.corpus)),
+            file_unique_id=f"{pack_name}:{index}",
+            file_size=len(data),
+        )
+
+    async def _sleep(self) -> None:
+        delay = self.latency_s + self._rng.uniform(0, self.jitter_s)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def get_pack(self, pack_name: str) -> EmojiPack:
+        await self._sleep()
+        return EmojiPack(
+            title=f"Synthetic {pack_name}",
+            short_name=pack_name,
+            items=[self._item(pack_name, index) for index in range(self.pack_size)],
+        )
+
+    async def resolve_custom_emoji(self, custom_emoji_ids: list[str]) -> CustomEmojiResolution:
+        await self._sleep()
+        return CustomEmojiResolution(
+            items=[self._item("message", int(custom_id)) for custom_id in custom_emoji_ids]
+        )
+
+    async def download_emoji(self, item: EmojiItem) -> bytes:
+        if item.file_id is None:
+            raise ProviderError("отсутствует file_id для скачивания")
+        await self._sleep()
+        self.downloads += 1
+        return self.corpus[int(item.file_id)]
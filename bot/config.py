@@ -11,12 +11,96 @@ class Settings(BaseModel):
     model_config = ConfigDict(extra="ignore", populate_by_name=True)
 
     bot_token: str = Field(alias="BOT_TOKEN")
+    telegram_api_base: str = Field(default="", alias="TELEGRAM_API_BASE")
+    bot_mode: str = Field(default="polling", alias="BOT_MODE")
     max_emojis_per_pack: int = Field(default=200, alias="MAX_EMOJIS_PER_PACK")
+    batch_max_packs: int = Field(default=10, alias="BATCH_MAX_PACKS")
     max_total_zip_mb: int = Field(default=50, alias="MAX_TOTAL_ZIP_MB")
+    multi_volume: bool = Field(default=True, alias="MULTI_VOLUME")
+    max_volumes: int = Field(default=10, alias="MAX_VOLUMES")
 
     download_timeout: int = Field(default=30, alias="DOWNLOAD_TIMEOUT")
     download_retries: int = Field(default=3, alias="DOWNLOAD_RETRIES")
     retry_backoff_base: float = Field(default=0.5, alias="RETRY_BACKOFF_BASE")
+    retry_max_delay: float = Field(default=10.0, alias="RETRY_MAX_DELAY")
+    retry_after_max: float = Field(default=60.0, alias="RETRY_AFTER_MAX")
+    retry_budget_ratio: float = Field(default=0.2, alias="RETRY_BUDGET_RATIO")
+    retry_budget_min_per_s: float = Field(default=5.0, alias="RETRY_BUDGET_MIN_PER_S")
+    breaker_failure_threshold: int = Field(default=20, alias="BREAKER_FAILURE_THRESHOLD")
+    breaker_reset_s: float = Field(default=30.0, alias="BREAKER_RESET_S")
+    hedge_max_ratio: float = Field(default=0.05, alias="HEDGE_MAX_RATIO")
+    hedge_quantile: float = Field(default=0.95, alias="HEDGE_QUANTILE")
+    hedge_min_delay: float = Field(default=0.2, alias="HEDGE_MIN_DELAY")
+    hedge_window: int = Field(default=500, alias="HEDGE_WINDOW")
+    max_file_mb: int = Field(default=4, alias="MAX_FILE_MB")
+    http_pool_limit: int = Field(default=100, alias="HTTP_POOL_LIMIT")
+    http_pool_limit_per_host: int = Field(default=32, alias="HTTP_POOL_LIMIT_PER_HOST")
+    http_dns_ttl: int = Field(default=300, alias="HTTP_DNS_TTL")
+    http_keepalive: float = Field(default=30.0, alias="HTTP_KEEPALIVE")
+    plan_json_ratio: float = Field(default=4.0, alias="PLAN_JSON_RATIO")
+    download_concurrency: int = Field(default=8, alias="DOWNLOAD_CONCURRENCY")
+    pipeline_buffer: int = Field(default=8, alias="PIPELINE_BUFFER")
+    export_workers: int = Field(default=4, alias="EXPORT_WORKERS")
+    export_max_queued_per_user: int = Field(default=1, alias="EXPORT_MAX_QUEUED_PER_USER")
+    export_backend: str = Field(default="inline", alias="EXPORT_BACKEND")
+    job_queue_path: str = Field(default=".cache/jobs.sqlite3", alias="JOB_QUEUE_PATH")
+    job_lease_s: float = Field(default=120.0, alias="JOB_LEASE_S")
+    job_poll_interval: float = Field(default=1.0, alias="JOB_POLL_INTERVAL")
+    job_max_attempts: int = Field(default=3, alias="JOB_MAX_ATTEMPTS")
+    archive_spool_mb: int = Field(default=16, alias="ARCHIVE_SPOOL_MB")
+    archive_deflate_level: int = Field(default=6, alias="ARCHIVE_DEFLATE_LEVEL")
+    archive_offload_kb: int = Field(default=64, alias="ARCHIVE_OFFLOAD_KB")
+
+    validation_executor: str = Field(default="process", alias="VALIDATION_EXECUTOR")
+    validation_workers: int = Field(default=0, alias="VALIDATION_WORKERS")
+    validation_batch_size: int = Field(default=8, alias="VALIDATION_BATCH_SIZE")
+    validation_batch_delay_ms: int = Field(default=20, alias="VALIDATION_BATCH_DELAY_MS")
+    tgs_validation_mode: str = Field(default="fast", alias="TGS_VALIDATION_MODE")
+    tgs_max_decompressed_mb: int = Field(default=16, alias="TGS_MAX_DECOMPRESSED_MB")
+
+    asset_cache_dir: str = Field(default=".cache/assets", alias="ASSET_CACHE_DIR")
+    asset_cache_max_mb: int = Field(default=512, alias="ASSET_CACHE_MAX_MB")
+
+    checkpoint_dir: str = Field(default=".cache/checkpoints", alias="CHECKPOINT_DIR")
+    checkpoint_ttl_s: float = Field(default=86400, alias="CHECKPOINT_TTL_S")
+    checkpoint_prune_interval_s: float = Field(default=3600, alias="CHECKPOINT_PRUNE_INTERVAL_S")
+
+    metadata_cache_ttl: float = Field(default=300, alias="METADATA_CACHE_TTL")
+    metadata_negative_ttl: float = Field(default=60, alias="METADATA_NEGATIVE_TTL")
+    metadata_cache_size: int = Field(default=1024, alias="METADATA_CACHE_SIZE")
+    custom_emoji_cache_size: int = Field(default=50000, alias="CUSTOM_EMOJI_CACHE_SIZE")
+    custom_emoji_concurrency: int = Field(default=4, alias="CUSTOM_EMOJI_CONCURRENCY")
+    custom_emoji_index_path: str = Field(
+        default=".cache/custom_emoji.sqlite3", alias="CUSTOM_EMOJI_INDEX_PATH"
+    )
+    custom_emoji_index_ttl_s: float = Field(default=7 * 24 * 3600, alias="CUSTOM_EMOJI_INDEX_TTL_S")
+
+    result_cache_ttl: float = Field(default=86400, alias="RESULT_CACHE_TTL")
+    result_cache_size: int = Field(default=4096, alias="RESULT_CACHE_SIZE")
+
+    state_backend: str = Field(default="sqlite", alias="STATE_BACKEND")
+    state_db_path: str = Field(default=".cache/state.sqlite3", alias="STATE_DB_PATH")
+    state_max_users: int = Field(default=10000, alias="STATE_MAX_USERS")
+    state_ttl_s: float = Field(default=30 * 24 * 3600, alias="STATE_TTL_S")
+    state_flush_interval: float = Field(default=2.0, alias="STATE_FLUSH_INTERVAL")
+
+    status_global_rate: float = Field(default=25.0, alias="STATUS_GLOBAL_RATE")
+    status_chat_rate: float = Field(default=1.0, alias="STATUS_CHAT_RATE")
+    status_chat_burst: float = Field(default=3.0, alias="STATUS_CHAT_BURST")
+    status_min_interval: float = Field(default=1.2, alias="STATUS_MIN_INTERVAL")
+
+    webhook_url: str = Field(default="", alias="WEBHOOK_URL")
+    webhook_path: str = Field(default="/webhook", alias="WEBHOOK_PATH")
+    webhook_secret: str = Field(default="", alias="WEBHOOK_SECRET")
+    webhook_host: str = Field(default="0.0.0.0", alias="WEBHOOK_HOST")
+    webhook_port: int = Field(default=8080, alias="WEBHOOK_PORT")
+    webhook_max_connections: int = Field(default=40, alias="WEBHOOK_MAX_CONNECTIONS")
+    webhook_concurrency: int = Field(default=64, alias="WEBHOOK_CONCURRENCY")
+    webhook_max_pending: int = Field(default=1024, alias="WEBHOOK_MAX_PENDING")
+    webhook_drain_timeout: float = Field(default=60.0, alias="WEBHOOK_DRAIN_TIMEOUT")
+
+    metrics_host: str = Field(default="127.0.0.1", alias="METRICS_HOST")
+    metrics_port: int = Field(default=0, alias="METRICS_PORT")
 
     log_level: str = Field(default="INFO", alias="LOG_LEVEL")
 
@@ -2,41 +2,112 @@
 
 import asyncio
 import logging
-import os
 import re
-import tempfile
 import time
+from contextlib import aclosing, nullcontext
+from dataclasses import asdict, replace
+from typing import Any, Callable
 
-from aiogram import F, Router
+from aiogram import Bot, F, Router
 from aiogram.exceptions import TelegramBadRequest, TelegramNetworkError, TelegramRetryAfter
-from aiogram.types import FSInputFile, Message, MessageEntity
+from aiogram.types import (
+    BufferedInputFile,
+    CallbackQuery,
+    FSInputFile,
+    InlineKeyboardMarkup,
+    InputFile,
+    Message,
+    MessageEntity,
+)
 
 from bot.config import Settings
-from bot.handlers.ui import build_back_kb, get_state, send_menu, safe_answer, with_signature
-from bot.schemas.manifest import ManifestItem, TgsMeta
-from bot.services.downloader import download_with_retry
-from bot.services.manifest_builder import build_manifest, write_manifest
-from bot.services.provider_base import DownloadError, EmojiPackProvider, ProviderError
-from bot.services.tgs_validator import TgsValidationError, validate_tgs
-from bot.services.zipper import build_zip
-from bot.utils.files import ensure_dir, sha256_hex
-from bot.utils.time import utc_now_filename
+from bot.handlers.ui import (
+    build_back_kb,
+    build_retry_kb,
+    get_state,
+    send_menu,
+    safe_answer,
+    with_signature,
+)
+from bot.services.asset_cache import AssetCache, asset_cache_key
+from bot.services.checkpoint import CheckpointStore, new_checkpoint_id
+from bot.services.exporter import (
+    ExportArtifact,
+    ExportError,
+    ExportRequest,
+    ExportVolume,
+    PackSection,
+    ProgressReporter,
+    build_export,
+)
+from bot.services.metrics import JOB_SECONDS, RETRY_AFTER, STAGE_SECONDS
+from bot.services.job_queue import JobQueue
+from bot.services.planner import plan_export
+from bot.services.provider_base import (
+    CircuitOpenError,
+    DownloadError,
+    EmojiItem,
+    EmojiPack,
+    EmojiPackProvider,
+    ProviderError,
+)
+from bot.services.result_cache import CachedResult, ResultCache
+from bot.services.scheduler import ExportScheduler, SchedulerBusy
+from bot.services.single_flight import SingleFlight
+from bot.services.state_store import MemoryStateStore, StateStore
+from bot.services.status_updater import StatusUpdater
+from bot.services.validation_pool import ValidationPool
 
 router = Router()
 logger = logging.getLogger(__name__)
 
+EXPORT_JOB_FIELDS = (
+    "source_url",
+    "source_pack_name",
+    "pack_title",
+    "pack_short_name",
+    "export_name",
+    "export_format",
+    "result_scope",
+)
+QUEUE_LIMIT_TEXT = "у вас уже есть экспорт в очереди, дождитесь его завершения"
 ADD_EMOJI_RE = re.compile(r"(?:https?://)?t\.me/addemoji/([A-Za-z0-9_]+)")
 
 
-class ExportError(Exception):
-    pass
+def parse_addemoji_urls(text: str) -> list[str]:
+    seen: set[str] = set()
+    result: list[str] = []
+    for match in ADD_EMOJI_RE.finditer(text):
+        pack_name = match.group(1)
+        if pack_name.lower() in seen:
+            continue
+        seen.add(pack_name.lower())
+        result.append(pack_name)
+    return result
 
 
-def parse_addemoji_url(text: str) -> str | None:
-    match = ADD_EMOJI_RE.search(text.strip())
-    if not match:
-        return None
-    return match.group(1)
+async def load_packs(
+    provider: EmojiPackProvider, pack_names: list[str]
+) -> tuple[list[EmojiPack], dict[str, str]]:
+    results = await asyncio.gather(
+        *(provider.get_pack(pack_name) for pack_name in pack_names), return_exceptions=True
+    )
+    packs: list[EmojiPack] = []
+    failed: dict[str, str] = {}
+    seen: set[str] = set()
+    for pack_name, result in zip(pack_names, results):
+        if isinstance(result, CircuitOpenError):
+            raise result
+        if isinstance(result, ProviderError):
+            failed[pack_name] = str(result)
+            continue
+        if isinstance(result, BaseException):
+            raise result
+        if result.short_name in seen:
+            continue
+        seen.add(result.short_name)
+        packs.append(result)
+    return packs, failed
 
 
 def extract_custom_emoji_ids(message: Message) -> list[str]:
@@ -62,12 +133,121 @@ def extract_custom_emoji_ids(message: Message) -> list[str]:
     return result
 
 
+async def send_archive(message: Message, document: InputFile | str) -> Message:
+    try:
+        with STAGE_SECONDS.time(stage="upload"):
+            return await message.answer_document(document, caption=with_signature(""))
+    except TelegramRetryAfter as exc:
+        RETRY_AFTER.inc(method="sendDocument")
+        await asyncio.sleep(exc.retry_after)
+        with STAGE_SECONDS.time(stage="upload"):
+            return await message.answer_document(document, caption=with_signature(""))
+    except TelegramNetworkError as exc:
+        raise ExportError("ошибка сети при отправке архива") from exc
+
+
+async def resend_cached(message: Message, file_id: str | None) -> bool:
+    if file_id is None:
+        return False
+    try:
+        await send_archive(message, file_id)
+    except TelegramBadRequest as exc:
+        logger.warning("cached archive rejected", extra={"error": str(exc)})
+        return False
+    return True
+
+
+async def resend_cached_volumes(message: Message, file_ids: list[str]) -> bool:
+    for file_id in file_ids:
+        if not await resend_cached(message, file_id):
+            return False
+    return bool(file_ids)
+
+
+async def deliver_volume(message: Message, volume: ExportVolume) -> str | None:
+    async with volume.lock:
+        if await resend_cached(message, volume.file_id):
+            return volume.file_id
+        volume.file_id = None
+
+        if volume.path is not None:
+            document: InputFile = FSInputFile(volume.path, filename=volume.file_name)
+        elif volume.data is not None:
+            document = BufferedInputFile(volume.data, filename=volume.file_name)
+        else:
+            raise ExportError("архив больше недоступен, повторите экспорт")
+
+        sent = await send_archive(message, document)
+        if sent.document is None:
+            return None
+        volume.file_id = sent.document.file_id
+        return volume.file_id
+
+
+async def deliver_artifact(
+    message: Message,
+    artifact: ExportArtifact,
+    request: ExportRequest,
+    result_cache: ResultCache | None,
+) -> None:
+    file_ids: list[str | None] = []
+    volumes = artifact.sealed_volumes()
+    async with aclosing(volumes):
+        async for volume in volumes:
+            file_ids.append(await deliver_volume(message, volume))
+
+    if result_cache is not None and request.result_scope is not None and all(file_ids):
+        result_cache.put(
+            request.result_scope,
+            request.export_format,
+            artifact.source_hashes,
+            CachedResult(file_ids=list(file_ids), file_name=artifact.file_name),
+        )
+
+
+async def ensure_status_message(message: Message, ui_store: StateStore) -> tuple[int, int] | None:
+    user_id = message.from_user.id if message.from_user else 0
+    state = get_state(ui_store, user_id)
+
+    status_message_id = state.get("menu_message_id")
+    status_chat_id = state.get("menu_chat_id")
+    if status_message_id and status_chat_id:
+        return status_chat_id, status_message_id
+
+    status = await safe_answer(message, text="получаю список эмодзи…", reply_markup=build_back_kb())
+    if status is None:
+        return None
+    ui_store.update(user_id, menu_message_id=status.message_id, menu_chat_id=status.chat.id)
+    return status.chat.id, status.message_id
+
+
+def build_job_payload(
+    message: Message,
+    status_ids: tuple[int, int],
+    items: list[EmojiItem],
+    *,
+    sections: list[PackSection] | None = None,
+    **export: Any,
+) -> dict[str, Any]:
+    status_chat_id, status_message_id = status_ids
+    payload = {
+        "message": message.model_dump(mode="json", exclude_none=True),
+        "status_chat_id": status_chat_id,
+        "status_message_id": status_message_id,
+        "items": [asdict(replace(item, document=None)) for item in items],
+        **{field: export[field] for field in EXPORT_JOB_FIELDS},
+    }
+    if sections:
+        payload["sections"] = [asdict(section) for section in sections]
+    return payload
+
+
 async def do_export(
     *,
     message: Message,
     config: Settings,
     provider: EmojiPackProvider,
-    ui_store: dict[int, dict],
+    ui_store: StateStore,
     items: list,
     source_url: str,
     source_pack_name: str,
@@ -75,170 +255,337 @@ async def do_export(
     pack_short_name: str,
     export_name: str,
     export_format: str,
+    asset_cache: AssetCache | None = None,
+    result_cache: ResultCache | None = None,
+    result_scope: str | None = None,
+    sections: list[PackSection] | None = None,
+    validator: ValidationPool | None = None,
+    scheduler: ExportScheduler | None = None,
+    export_flights: SingleFlight[ExportArtifact] | None = None,
+    status_updater: StatusUpdater | None = None,
+    checkpoints: CheckpointStore | None = None,
+    checkpoint_id: str | None = None,
 ) -> None:
     user_id = message.from_user.id if message.from_user else 0
-    state = get_state(ui_store, user_id)
+    status_ids = await ensure_status_message(message, ui_store)
+    if status_ids is None:
+        return
+    status_chat_id, status_message_id = status_ids
 
-    status_message_id = state.get("menu_message_id")
-    status_chat_id = state.get("menu_chat_id")
+    updater = status_updater or StatusUpdater(message.bot)
+    started = time.perf_counter()
+    outcome = "error"
 
-    if not status_message_id or not status_chat_id:
-        status = await safe_answer(message, text="получаю список эмодзи…", reply_markup=build_back_kb())
-        if status is None:
-            return
-        status_message_id = status.message_id
-        status_chat_id = status.chat.id
-        state["menu_message_id"] = status_message_id
-        state["menu_chat_id"] = status_chat_id
-
-    last_text = ""
-    last_edit_ts = 0.0
-    min_interval_s = 1.2
-
-    async def update_status(text: str, *, force: bool = False) -> None:
-        nonlocal last_text, last_edit_ts
-        if text == last_text:
-            return
-        now = time.monotonic()
-        if not force and (now - last_edit_ts) < min_interval_s:
-            return
+    checkpoint = None
+    if checkpoints is not None:
+        checkpoint_id = checkpoint_id or new_checkpoint_id()
         try:
-            await message.bot.edit_message_text(
-                with_signature(text),
-                chat_id=status_chat_id,
-                message_id=status_message_id,
-                reply_markup=build_back_kb(),
+            payload = build_job_payload(
+                message,
+                status_ids,
+                items,
+                source_url=source_url,
+                source_pack_name=source_pack_name,
+                pack_title=pack_title,
+                pack_short_name=pack_short_name,
+                export_name=export_name,
+                export_format=export_format,
+                result_scope=result_scope,
+                sections=sections,
             )
-            last_text = text
-            last_edit_ts = time.monotonic()
-        except TelegramRetryAfter as exc:
-            if not force:
-                return
-            await asyncio.sleep(exc.retry_after)
-            try:
-                await message.bot.edit_message_text(
-                    with_signature(text),
-                    chat_id=status_chat_id,
-                    message_id=status_message_id,
-                    reply_markup=build_back_kb(),
-                )
-                last_text = text
-                last_edit_ts = time.monotonic()
-            except (TelegramBadRequest, TelegramNetworkError):
-                return
-        except (TelegramBadRequest, TelegramNetworkError):
+            payload["checkpoint_id"] = checkpoint_id
+            checkpoint = await asyncio.to_thread(
+                checkpoints.open, checkpoint_id, user_id, payload
+            )
+        except (OSError, ValueError) as exc:
+            logger.warning(
+                "checkpoint unavailable, exporting without it",
+                extra={"checkpoint": checkpoint_id, "error": str(exc)},
+            )
+
+    async def update_status(
+        text: str, *, force: bool = False, reply_markup: InlineKeyboardMarkup | None = None
+    ) -> None:
+        await updater.update(
+            status_chat_id,
+            status_message_id,
+            with_signature(text),
+            reply_markup=reply_markup or build_back_kb(),
+            force=force,
+        )
+
+    async def fail(text: str) -> None:
+        ui_store.update(user_id, awaiting=False)
+        if checkpoint is None:
+            await update_status(text, force=True)
             return
+        await asyncio.to_thread(checkpoint.mark, "failed", error=text)
+        await update_status(text, force=True, reply_markup=build_retry_kb(checkpoint.id))
 
     await update_status("получаю список эмодзи…", force=True)
 
+    request = ExportRequest(
+        items=items,
+        source_url=source_url,
+        source_pack_name=source_pack_name,
+        pack_title=pack_title,
+        pack_short_name=pack_short_name,
+        export_name=export_name,
+        export_format=export_format,
+        result_scope=result_scope,
+        sections=sections or [],
+    )
+
+    async def build(
+        report: ProgressReporter, publish: Callable[[ExportArtifact], None]
+    ) -> ExportArtifact:
+        return await build_export(
+            request,
+            config=config,
+            provider=provider,
+            report=report,
+            asset_cache=asset_cache,
+            result_cache=result_cache,
+            validator=validator,
+            scheduler=scheduler,
+            publish=publish,
+            checkpoint=checkpoint,
+        )
+
     try:
-        if len(items) > config.max_emojis_per_pack:
+        max_items = config.max_emojis_per_pack * max(1, len(request.sections))
+        if len(items) > max_items:
+            raise ExportError(f"слишком много эмодзи: {len(items)} (лимит {max_items})")
+
+        if result_cache is not None and result_scope is not None and asset_cache is not None:
+            known_hashes = await asyncio.to_thread(
+                lambda: [asset_cache.get_sha256(asset_cache_key(item)) for item in items]
+            )
+            if all(known_hashes):
+                cached = result_cache.get(result_scope, export_format, known_hashes)
+                if cached is not None and await resend_cached_volumes(message, cached.file_ids):
+                    outcome = "cached"
+                    if checkpoint is not None:
+                        await asyncio.to_thread(checkpoint.remove)
+                    ui_store.update(user_id, awaiting=False)
+                    await update_status("готово ✅", force=True)
+                    return
+                if cached is not None:
+                    result_cache.invalidate(result_scope, export_format)
+
+        max_volumes = max(1, config.max_volumes) if config.multi_volume else 1
+        with STAGE_SECONDS.time(stage="plan"):
+            plan = await plan_export(
+                items,
+                provider=provider,
+                export_format=export_format,
+                limit_bytes=config.max_total_zip_mb * 1024 * 1024 * max_volumes,
+                json_ratio=config.plan_json_ratio,
+                concurrency=config.download_concurrency,
+            )
+        logger.info(
+            "export plan",
+            extra={
+                "items": plan.items,
+                "sized_items": plan.sized_items,
+                "estimated_bytes": plan.estimated_bytes,
+            },
+        )
+        if not plan.fits:
             raise ExportError(
-                f"слишком много эмодзи: {len(items)} (лимит {config.max_emojis_per_pack})"
+                f"архив получится слишком большим: ~{plan.estimated_bytes / 1024 / 1024:.1f} МБ "
+                f"(лимит {config.max_total_zip_mb * max_volumes} МБ)"
             )
 
-        total_limit_bytes = config.max_total_zip_mb * 1024 * 1024
-        items_manifest: list[ManifestItem] = []
-
-        with tempfile.TemporaryDirectory() as tmpdir:
-            assets_dir = os.path.join(tmpdir, "assets")
-            ensure_dir(assets_dir)
-
-            total_bytes = 0
-            total = len(items)
-
-            for index, item in enumerate(items):
-                await update_status(f"скачиваю ({index + 1}/{total})…")
-
-                data = await download_with_retry(
-                    provider=provider,
-                    item=item,
-                    timeout_s=config.download_timeout,
-                    retries=config.download_retries,
-                    backoff_base=config.retry_backoff_base,
-                    logger=logger,
-                )
-
-                await update_status("проверяю tgs…")
-
-                try:
-                    result = validate_tgs(data)
-                except TgsValidationError as exc:
-                    raise ExportError(f"ошибка в tgs: {exc}") from exc
-
-                if export_format == "json":
-                    payload = result.json_bytes
-                    ext = "json"
-                    mime = "application/json"
-                else:
-                    payload = data
-                    ext = "tgs"
-                    mime = "application/x-tgsticker"
-
-                total_bytes += len(payload)
-                if total_bytes > total_limit_bytes:
-                    raise ExportError("превышен лимит размера архива")
-
-                file_name = f"{index:04d}.{ext}"
-                file_path = os.path.join(assets_dir, file_name)
-                with open(file_path, "wb") as file_handle:
-                    file_handle.write(payload)
-
-                items_manifest.append(
-                    ManifestItem(
-                        index=index,
-                        custom_emoji_id=item.custom_emoji_id,
-                        file_name=f"assets/{file_name}",
-                        mime=mime,
-                        sha256=sha256_hex(payload),
-                        tgs_meta=TgsMeta(
-                            w=result.meta.w,
-                            h=result.meta.h,
-                            fr=result.meta.fr,
-                            ip=result.meta.ip,
-                            op=result.meta.op,
-                        ),
-                    )
-                )
-
-            await update_status("собираю архив…")
-
-            manifest = build_manifest(
-                source_url=source_url,
-                source_pack_name=source_pack_name,
-                pack_title=pack_title,
-                pack_short_name=pack_short_name,
-                items=items_manifest,
-            )
-            manifest_path = os.path.join(tmpdir, "manifest.json")
-            write_manifest(manifest, manifest_path)
-
-            zip_name = f"export_{export_name}_{utc_now_filename()}.zip"
-            zip_path = os.path.join(tmpdir, zip_name)
-            build_zip(zip_path, manifest_path, assets_dir)
-
-            try:
-                await message.answer_document(
-                    FSInputFile(zip_path, filename=zip_name), caption=with_signature("")
-                )
-            except TelegramRetryAfter as exc:
-                await asyncio.sleep(exc.retry_after)
-                await message.answer_document(
-                    FSInputFile(zip_path, filename=zip_name), caption=with_signature("")
-                )
-            except TelegramNetworkError as exc:
-                raise ExportError("ошибка сети при отправке архива") from exc
-
-            state["awaiting"] = False
-            await update_status("готово ✅", force=True)
-
-    except (ProviderError, DownloadError, ExportError) as exc:
-        state["awaiting"] = False
-        await update_status(f"экспорт прерван: {exc}", force=True)
+        flights = export_flights or SingleFlight(cleanup=ExportArtifact.cleanup)
+        with scheduler.admit(user_id) if scheduler is not None else nullcontext():
+            async with flights.join(
+                request.flight_key, build, on_progress=update_status
+            ) as artifact:
+                await deliver_artifact(message, artifact, request, result_cache)
+
+        outcome = "ok"
+        if checkpoint is not None:
+            await asyncio.to_thread(checkpoint.remove)
+        ui_store.update(user_id, awaiting=False)
+        await update_status("готово ✅", force=True)
+
+    except (ProviderError, DownloadError, ExportError, SchedulerBusy) as exc:
+        await fail(f"экспорт прерван: {exc}")
     except Exception:  # noqa: BLE001
         logger.exception("unexpected export error")
-        state["awaiting"] = False
-        await update_status("экспорт прерван: неизвестная ошибка", force=True)
+        await fail("экспорт прерван: неизвестная ошибка")
+    finally:
+        JOB_SECONDS.observe(time.perf_counter() - started, format=export_format, result=outcome)
+        if status_updater is None:
+            await updater.close()
+
+
+async def queue_limit_reached(job_queue: JobQueue, user_id: int, config: Settings) -> bool:
+    active = await asyncio.to_thread(job_queue.active_for_user, user_id)
+    return active >= max(1, config.export_max_queued_per_user)
+
+
+async def enqueue_export(
+    *,
+    message: Message,
+    config: Settings,
+    ui_store: StateStore,
+    job_queue: JobQueue,
+    items: list[EmojiItem],
+    status_updater: StatusUpdater | None = None,
+    **export: Any,
+) -> None:
+    user_id = message.from_user.id if message.from_user else 0
+    status_ids = await ensure_status_message(message, ui_store)
+    if status_ids is None:
+        return
+    status_chat_id, status_message_id = status_ids
+
+    if await queue_limit_reached(job_queue, user_id, config):
+        text = f"экспорт прерван: {QUEUE_LIMIT_TEXT}"
+    else:
+        payload = build_job_payload(message, status_ids, items, **export)
+        payload["checkpoint_id"] = new_checkpoint_id()
+        job_id = await job_queue.enqueue(user_id, payload)
+        logger.info("export enqueued", extra={"job_id": job_id, "items": len(items)})
+        text = "экспорт в очереди…"
+
+    ui_store.update(user_id, awaiting=False)
+    updater = status_updater or StatusUpdater(message.bot)
+    try:
+        await updater.update(
+            status_chat_id,
+            status_message_id,
+            with_signature(text),
+            reply_markup=build_back_kb(),
+            force=True,
+        )
+    finally:
+        if status_updater is None:
+            await updater.close()
+
+
+async def run_export_job(
+    bot: Bot,
+    payload: dict[str, Any],
+    *,
+    config: Settings,
+    provider: EmojiPackProvider,
+    asset_cache: AssetCache | None = None,
+    result_cache: ResultCache | None = None,
+    validator: ValidationPool | None = None,
+    scheduler: ExportScheduler | None = None,
+    export_flights: SingleFlight[ExportArtifact] | None = None,
+    status_updater: StatusUpdater | None = None,
+    checkpoints: CheckpointStore | None = None,
+) -> None:
+    message = Message.model_validate(payload["message"]).as_(bot)
+    user_id = message.from_user.id if message.from_user else 0
+    ui_store = MemoryStateStore(max_users=1, ttl_s=0)
+    ui_store.update(
+        user_id,
+        menu_message_id=payload["status_message_id"],
+        menu_chat_id=payload["status_chat_id"],
+    )
+    await do_export(
+        message=message,
+        config=config,
+        provider=provider,
+        ui_store=ui_store,
+        items=[EmojiItem(**item) for item in payload["items"]],
+        sections=[PackSection(**section) for section in payload.get("sections", [])],
+        asset_cache=asset_cache,
+        result_cache=result_cache,
+        validator=validator,
+        scheduler=scheduler,
+        export_flights=export_flights,
+        status_updater=status_updater,
+        checkpoints=checkpoints,
+        checkpoint_id=payload.get("checkpoint_id"),
+        **{field: payload[field] for field in EXPORT_JOB_FIELDS},
+    )
+
+
+async def recover_checkpoints(checkpoints: CheckpointStore, updater: StatusUpdater) -> None:
+    for checkpoint in await asyncio.to_thread(checkpoints.scan):
+        if not checkpoint.orphaned():
+            continue
+        text = "экспорт прерван: бот был перезапущен"
+        await asyncio.to_thread(checkpoint.mark, "failed", error=text)
+        logger.info("export interrupted by restart", extra={"checkpoint": checkpoint.id})
+        await updater.update(
+            checkpoint.payload["status_chat_id"],
+            checkpoint.payload["status_message_id"],
+            with_signature(text),
+            reply_markup=build_retry_kb(checkpoint.id),
+            force=True,
+        )
+
+
+@router.callback_query(F.data.startswith("retry:"))
+async def retry_export(
+    callback: CallbackQuery,
+    config: Settings,
+    provider: EmojiPackProvider,
+    asset_cache: AssetCache | None = None,
+    result_cache: ResultCache | None = None,
+    validator: ValidationPool | None = None,
+    scheduler: ExportScheduler | None = None,
+    export_flights: SingleFlight[ExportArtifact] | None = None,
+    status_updater: StatusUpdater | None = None,
+    job_queue: JobQueue | None = None,
+    checkpoints: CheckpointStore | None = None,
+    release_slot: Callable[[], None] | None = None,
+) -> None:
+    checkpoint_id = (callback.data or "").split(":", 1)[1]
+    user_id = callback.from_user.id if callback.from_user else 0
+    checkpoint = None
+    if checkpoints is not None:
+        checkpoint = await asyncio.to_thread(checkpoints.load, checkpoint_id)
+
+    if checkpoint is None or checkpoint.user_id != user_id:
+        await callback.answer("экспорт больше недоступен, отправьте ссылку заново", show_alert=True)
+        return
+    if checkpoint.status == "running" and not checkpoint.orphaned():
+        await callback.answer("экспорт уже выполняется")
+        return
+    queued = config.export_backend == "queue" and job_queue is not None
+    if queued and await queue_limit_reached(job_queue, user_id, config):
+        await callback.answer(QUEUE_LIMIT_TEXT)
+        return
+    await asyncio.to_thread(checkpoint.mark, "running")
+    await callback.answer()
+
+    payload = checkpoint.payload
+    if queued:
+        job_id = await job_queue.enqueue(user_id, payload)
+        logger.info("export retry enqueued", extra={"job_id": job_id, "checkpoint": checkpoint.id})
+        if status_updater is not None:
+            await status_updater.update(
+                payload["status_chat_id"],
+                payload["status_message_id"],
+                with_signature("экспорт в очереди…"),
+                reply_markup=build_back_kb(),
+                force=True,
+            )
+        return
+
+    if release_slot is not None:
+        release_slot()
+    await run_export_job(
+        callback.bot,
+        payload,
+        config=config,
+        provider=provider,
+        asset_cache=asset_cache,
+        result_cache=result_cache,
+        validator=validator,
+        scheduler=scheduler,
+        export_flights=export_flights,
+        status_updater=status_updater,
+        checkpoints=checkpoints,
+    )
 
 
 @router.message()
@@ -246,13 +593,22 @@ async def export_link(
     message: Message,
     config: Settings,
     provider: EmojiPackProvider,
-    ui_store: dict[int, dict],
+    ui_store: StateStore,
+    asset_cache: AssetCache | None = None,
+    result_cache: ResultCache | None = None,
+    validator: ValidationPool | None = None,
+    scheduler: ExportScheduler | None = None,
+    export_flights: SingleFlight[ExportArtifact] | None = None,
+    status_updater: StatusUpdater | None = None,
+    job_queue: JobQueue | None = None,
+    checkpoints: CheckpointStore | None = None,
+    release_slot: Callable[[], None] | None = None,
 ) -> None:
     text = message.text or ""
-    pack_name = parse_addemoji_url(text) if text else None
+    pack_names = parse_addemoji_urls(text) if text else []
     custom_emoji_ids = extract_custom_emoji_ids(message)
 
-    if not pack_name and not custom_emoji_ids:
+    if not pack_names and not custom_emoji_ids:
         return
 
     user_id = message.from_user.id if message.from_user else 0
@@ -263,8 +619,49 @@ async def export_link(
         return
 
     export_format = state.get("format", "tgs")
+    sections: list[PackSection] = []
+
+    if len(pack_names) > config.batch_max_packs:
+        await send_menu(
+            message,
+            ui_store,
+            note=f"слишком много наборов: {len(pack_names)} (лимит {config.batch_max_packs})",
+        )
+        return
 
-    if pack_name:
+    if len(pack_names) > 1:
+        try:
+            packs, failed = await load_packs(provider, pack_names)
+        except ProviderError as exc:
+            await send_menu(message, ui_store, note=str(exc))
+            return
+        if failed:
+            logger.warning("packs not resolved", extra={"failed": list(failed)})
+            if not packs:
+                await send_menu(message, ui_store, note=next(iter(failed.values())))
+                return
+            await safe_answer(
+                message,
+                text=f"не удалось получить наборы: {', '.join(failed)} — они будут пропущены",
+            )
+        source_url = f"message:{message.chat.id}:{message.message_id}"
+        export_name = f"batch_{message.message_id}"
+        pack_title = f"Batch of {len(packs)} packs"
+        pack_short_name = "batch"
+        source_pack_name = ",".join(pack.short_name for pack in packs)
+        result_scope = f"batch:{source_pack_name}"
+        items = [item for pack in packs for item in pack.items]
+        sections = [
+            PackSection(
+                short_name=pack.short_name,
+                title=pack.title,
+                source_url=f"https://t.me/addemoji/{pack.short_name}",
+                size=len(pack.items),
+            )
+            for pack in packs
+        ]
+    elif pack_names:
+        pack_name = pack_names[0]
         source_url = f"https://t.me/addemoji/{pack_name}"
         export_name = pack_name
         try:
@@ -276,22 +673,61 @@ async def export_link(
         pack_short_name = pack.short_name
         items = pack.items
         source_pack_name = pack_name
+        result_scope = pack.short_name
     else:
         source_url = f"message:{message.chat.id}:{message.message_id}"
         export_name = f"custom_emoji_{message.message_id}"
         pack_title = "Custom Emoji Message"
         pack_short_name = "custom_emoji_message"
         source_pack_name = pack_short_name
+        result_scope = None
         try:
-            items = await provider.get_custom_emoji_items(custom_emoji_ids)
+            resolution = await provider.resolve_custom_emoji(custom_emoji_ids)
         except ProviderError as exc:
             await send_menu(message, ui_store, note=str(exc))
             return
+        items = resolution.items
+        if resolution.missing:
+            logger.warning(
+                "custom emoji not resolved",
+                extra={"missing": len(resolution.missing), "total": len(custom_emoji_ids)},
+            )
+            if not items:
+                await send_menu(message, ui_store, note="не удалось получить эмодзи по id")
+                return
+            await safe_answer(
+                message,
+                text=(
+                    f"не удалось получить {len(resolution.missing)} из {len(custom_emoji_ids)} "
+                    "эмодзи, они будут пропущены"
+                ),
+            )
 
     if not items:
         await send_menu(message, ui_store, note="Не найдено эмодзи для экспорта.")
         return
 
+    if config.export_backend == "queue" and job_queue is not None:
+        await enqueue_export(
+            message=message,
+            config=config,
+            ui_store=ui_store,
+            job_queue=job_queue,
+            items=items,
+            status_updater=status_updater,
+            source_url=source_url,
+            source_pack_name=source_pack_name,
+            pack_title=pack_title,
+            pack_short_name=pack_short_name,
+            export_name=export_name,
+            export_format=export_format,
+            result_scope=result_scope,
+            sections=sections,
+        )
+        return
+
+    if release_slot is not None:
+        release_slot()
     await do_export(
         message=message,
         config=config,
@@ -304,4 +740,13 @@ async def export_link(
         pack_short_name=pack_short_name,
         export_name=export_name,
         export_format=export_format,
+        asset_cache=asset_cache,
+        result_cache=result_cache,
+        result_scope=result_scope,
+        sections=sections,
+        validator=validator,
+        scheduler=scheduler,
+        export_flights=export_flights,
+        status_updater=status_updater,
+        checkpoints=checkpoints,
     )
@@ -2,12 +2,15 @@
 
 import asyncio
 import logging
-from typing import Any, Optional
+from typing import Any, Awaitable, Callable, Optional
 
-from aiogram.types import InlineKeyboardMarkup, Message
+from aiogram.types import InlineKeyboardMarkup, Message, TelegramObject
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.exceptions import TelegramBadRequest, TelegramNetworkError, TelegramRetryAfter
 
+from bot.services.metrics import RETRY_AFTER
+from bot.services.state_store import StateStore
+
 logger = logging.getLogger(__name__)
 
 SIGNATURE = "powered by @Larrygraphics"
@@ -19,16 +22,20 @@ def with_signature(text: str) -> str:
     return f"{text}\n\n{SIGNATURE}"
 
 
-def get_state(store: dict[int, dict[str, Any]], user_id: int) -> dict[str, Any]:
-    return store.setdefault(
-        user_id,
-        {
-            "format": "tgs",
-            "awaiting": False,
-            "menu_message_id": None,
-            "menu_chat_id": None,
-        },
-    )
+def get_state(store: StateStore, user_id: int) -> dict[str, Any]:
+    return store.get(user_id)
+
+
+async def preload_state(
+    handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+    event: TelegramObject,
+    data: dict[str, Any],
+) -> Any:
+    user = data.get("event_from_user")
+    store = data.get("ui_store")
+    if user is not None and store is not None:
+        await store.preload(user.id)
+    return await handler(event, data)
 
 
 def menu_text(fmt: str) -> str:
@@ -62,7 +69,14 @@ def build_back_kb() -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
-async def send_menu(message: Message, store: dict[int, dict[str, Any]], note: str | None = None) -> Message:
+def build_retry_kb(checkpoint_id: str) -> InlineKeyboardMarkup:
+    builder = InlineKeyboardBuilder()
+    builder.button(text="Повторить", callback_data=f"retry:{checkpoint_id}")
+    builder.button(text="Меню", callback_data="menu")
+    return builder.adjust(2).as_markup()
+
+
+async def send_menu(message: Message, store: StateStore, note: str | None = None) -> Message:
     user_id = message.from_user.id if message.from_user else 0
     state = get_state(store, user_id)
     text = menu_text(state["format"])
@@ -71,11 +85,9 @@ async def send_menu(message: Message, store: dict[int, dict[str, Any]], note: st
     msg = await safe_answer(message, text=text, reply_markup=build_menu_kb())
     if msg is None:
         # Fallback: keep state but no menu message available
-        state["awaiting"] = False
+        store.update(user_id, awaiting=False)
         return message
-    state["menu_message_id"] = msg.message_id
-    state["menu_chat_id"] = msg.chat.id
-    state["awaiting"] = False
+    store.update(user_id, menu_message_id=msg.message_id, menu_chat_id=msg.chat.id, awaiting=False)
     return msg
 
 
@@ -86,10 +98,11 @@ async def safe_answer(
     try:
         return await message.answer(text, reply_markup=reply_markup)
     except TelegramRetryAfter as exc:
+        RETRY_AFTER.inc(method="sendMessage")
         await asyncio.sleep(exc.retry_after)
         try:
             return await message.answer(text, reply_markup=reply_markup)
-        except (TelegramBadRequest, TelegramNetworkError) as retry_exc:
+        except (TelegramBadRequest, TelegramNetworkError, TelegramRetryAfter) as retry_exc:
             logger.warning("safe_answer failed after retry: %s", retry_exc)
             return None
     except (TelegramBadRequest, TelegramNetworkError) as exc:
@@ -105,11 +118,12 @@ async def safe_edit(
         await message.edit_text(text, reply_markup=reply_markup)
         return True
     except TelegramRetryAfter as exc:
+        RETRY_AFTER.inc(method="editMessageText")
         await asyncio.sleep(exc.retry_after)
         try:
             await message.edit_text(text, reply_markup=reply_markup)
             return True
-        except (TelegramBadRequest, TelegramNetworkError) as retry_exc:
+        except (TelegramBadRequest, TelegramNetworkError, TelegramRetryAfter) as retry_exc:
             logger.warning("safe_edit failed after retry: %s", retry_exc)
             return False
     except (TelegramBadRequest, TelegramNetworkError) as exc:
@@ -11,33 +11,88 @@ if __package__ is None or __package__ == "":
 from aiogram import Bot, Dispatcher
 
 from bot.config import load_settings
-from bot.handlers.export_link import router as export_router
+from bot.handlers.export_link import recover_checkpoints, router as export_router
 from bot.handlers.start import router as start_router
+from bot.handlers.ui import preload_state
 from bot.logging_setup import setup_logging
+from bot.services.asset_cache import create_asset_cache
+from bot.services.checkpoint import create_checkpoint_store, prune_checkpoints
+from bot.services.exporter import ExportArtifact
+from bot.services.http_session import create_bot_session
+from bot.services.job_queue import create_job_queue
+from bot.services.metrics import IN_FLIGHT, QUEUE_DEPTH, configure_metrics, start_metrics_server
 from bot.services.provider_base import EmojiPackProvider, create_provider
+from bot.services.result_cache import create_result_cache
+from bot.services.scheduler import create_scheduler
+from bot.services.single_flight import SingleFlight
+from bot.services.state_store import create_state_store
+from bot.services.status_updater import create_status_updater
+from bot.services.validation_pool import create_validation_pool
+from bot.webhook import run_webhook
 
 
 async def main() -> None:
     settings = load_settings()
     setup_logging(settings.log_level)
 
-    bot = Bot(token=settings.bot_token)
+    session = create_bot_session(settings)
+    bot = Bot(token=settings.bot_token, session=session)
     dp = Dispatcher()
     dp.include_router(start_router)
     dp.include_router(export_router)
+    dp.update.outer_middleware(preload_state)
 
     provider: EmojiPackProvider = create_provider(settings, bot)
     dp["provider"] = provider
-    dp["ui_store"] = {}
+    ui_store = create_state_store(settings)
+    dp["ui_store"] = ui_store
+    status_updater = create_status_updater(settings, bot)
+    dp["status_updater"] = status_updater
+    scheduler = create_scheduler(settings)
+    dp["scheduler"] = scheduler
+    dp["export_flights"] = SingleFlight(cleanup=ExportArtifact.cleanup)
+    dp["asset_cache"] = create_asset_cache(settings)
+    dp["result_cache"] = create_result_cache(settings)
+    validator = create_validation_pool(settings)
+    dp["validator"] = validator
+    job_queue = create_job_queue(settings) if settings.export_backend == "queue" else None
+    dp["job_queue"] = job_queue
+    checkpoints = create_checkpoint_store(settings)
+    dp["checkpoints"] = checkpoints
+    if checkpoints is not None and job_queue is None:
+        await recover_checkpoints(checkpoints, status_updater)
+    pruner = None
+    if checkpoints is not None:
+        pruner = asyncio.create_task(
+            prune_checkpoints(checkpoints, interval_s=settings.checkpoint_prune_interval_s)
+        )
 
-    async def on_shutdown(_: Dispatcher) -> None:
+    metrics_runner = None
+    if configure_metrics(settings):
+        QUEUE_DEPTH.set_function(job_queue.depth if job_queue else lambda: scheduler.queued)
+        IN_FLIGHT.set_function(lambda: scheduler.running)
+        metrics_runner = await start_metrics_server(settings.metrics_host, settings.metrics_port)
+
+    async def on_shutdown() -> None:
+        if pruner is not None:
+            pruner.cancel()
         await provider.close()
+        await validator.close()
+        await ui_store.close()
+        await status_updater.close()
+        if job_queue is not None:
+            await job_queue.close()
         await bot.session.close()
-        logging.getLogger(__name__).info("shutdown complete")
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        logging.getLogger(__name__).info("shutdown complete", extra=session.stats.snapshot())
 
     dp.shutdown.register(on_shutdown)
 
-    await dp.start_polling(bot, config=settings)
+    if settings.bot_mode == "webhook":
+        await run_webhook(dp, bot, settings)
+    else:
+        await dp.start_polling(bot, config=settings)
 
 
 if __name__ == "__main__":
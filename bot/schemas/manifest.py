@@ -1,6 +1,6 @@
 ﻿from __future__ import annotations
 
-from typing import List
+from typing import List, Optional
 
 from pydantic import BaseModel, Field
 
@@ -16,10 +16,12 @@ class TgsMeta(BaseModel):
 class ManifestItem(BaseModel):
     index: int
     custom_emoji_id: str
+    pack: Optional[str] = None
     file_name: str
     mime: str = Field(default="application/x-tgsticker")
     sha256: str
     tgs_meta: TgsMeta
+    volume: Optional[int] = None
 
 
 class ManifestSource(BaseModel):
@@ -32,6 +34,7 @@ class ManifestPack(BaseModel):
     title: str
     short_name: str
     emoji_count: int
+    url: Optional[str] = None
 
 
 class Manifest(BaseModel):
@@ -39,4 +42,6 @@ class Manifest(BaseModel):
     exported_at: str
     source: ManifestSource
     pack: ManifestPack
+    volumes: Optional[int] = None
+    packs: Optional[List[ManifestPack]] = None
     items: List[ManifestItem]
\ No newline at end of file
@@ -0,0 +1,175 @@
+﻿from __future__ import annotations
+
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from bot.config import Settings
+from bot.services.provider_base import EmojiItem
+from bot.services.tgs_validator import TgsMeta
+from bot.utils.files import ensure_dir, sha256_hex
+
+logger = logging.getLogger(__name__)
+
+RESCAN_FRACTION = 0.05
+
+
+@dataclass
+class CachedAsset:
+    data: bytes
+    meta: TgsMeta
+    sha256: str
+
+
+class AssetCache:
+    def __init__(self, root: str | Path, max_bytes: int) -> None:
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._index: OrderedDict[str, int] = OrderedDict()
+        self._total_bytes = 0
+        self._unscanned_bytes = 0
+        ensure_dir(self.root)
+        self._load_index()
+
+    def _path(self, key: str) -> Path:
+        digest = sha256_hex(key.encode("utf-8"))
+        return self.root / digest[:2] / f"{digest}.asset"
+
+    def _scan(self) -> list[tuple[float, str, int]]:
+        entries: list[tuple[float, str, int]] = []
+        for path in self.root.glob("*/*.asset"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, str(path), stat.st_size))
+        return sorted(entries)
+
+    def _load_index(self) -> None:
+        entries = self._scan()
+        with self._lock:
+            self._index.clear()
+            self._total_bytes = 0
+            self._unscanned_bytes = 0
+            for _, path, size in entries:
+                self._index[path] = size
+                self._total_bytes += size
+            self._evict()
+
+    def get(self, key: str) -> CachedAsset | None:
+        path = self._path(key)
+        try:
+            raw = path.read_bytes()
+            header, data = raw.split(b"\n", 1)
+            info = json.loads(header)
+            if sha256_hex(data) != info["sha256"]:
+                raise ValueError("checksum mismatch")
+            meta = TgsMeta(**info["meta"])
+        except FileNotFoundError:
+            with self._lock:
+                self._forget(str(path))
+                self.misses += 1
+            return None
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("dropping corrupt cache entry", extra={"key": key, "error": str(exc)})
+            with self._lock:
+                self._remove(str(path))
+                self.misses += 1
+            return None
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            key_path = str(path)
+            if key_path not in self._index:
+                self._index[key_path] = len(raw)
+                self._total_bytes += len(raw)
+            self._index.move_to_end(key_path)
+            self.hits += 1
+        return CachedAsset(data=data, meta=meta, sha256=info["sha256"])
+
+    def get_sha256(self, key: str) -> str | None:
+        try:
+            with self._path(key).open("rb") as file_handle:
+                return json.loads(file_handle.readline())["sha256"]
+        except Exception:  # noqa: BLE001
+            return None
+
+    def put(self, key: str, data: bytes, meta: TgsMeta) -> None:
+        path = self._path(key)
+        header = json.dumps({"key": key, "sha256": sha256_hex(data), "meta": asdict(meta)})
+        raw = header.encode("utf-8") + b"\n" + data
+        if len(raw) > self.max_bytes:
+            return
+
+        ensure_dir(path.parent)
+        fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file_handle:
+                file_handle.write(raw)
+            os.replace(tmp_name, path)
+        except OSError as exc:
+            logger.warning("failed to write cache entry", extra={"key": key, "error": str(exc)})
+            try:
+                os.unlink(tmp_name)
+            except OSError:
+                pass
+            return
+
+        with self._lock:
+            key_path = str(path)
+            self._forget(key_path)
+            self._index[key_path] = len(raw)
+            self._total_bytes += len(raw)
+            self._unscanned_bytes += len(raw)
+            rescan = self._unscanned_bytes >= self.max_bytes * RESCAN_FRACTION
+            if not rescan:
+                self._evict()
+        if rescan:
+            self._load_index()
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._index),
+                "bytes": self._total_bytes,
+            }
+
+    def _forget(self, key_path: str) -> None:
+        size = self._index.pop(key_path, None)
+        if size is not None:
+            self._total_bytes -= size
+
+    def _remove(self, key_path: str) -> None:
+        self._forget(key_path)
+        try:
+            os.unlink(key_path)
+        except OSError:
+            pass
+
+    def _evict(self) -> None:
+        while self._total_bytes > self.max_bytes and self._index:
+            oldest = next(iter(self._index))
+            self._remove(oldest)
+
+
+def asset_cache_key(item: EmojiItem) -> str:
+    return item.file_unique_id or item.custom_emoji_id
+
+
+def create_asset_cache(settings: Settings) -> AssetCache | None:
+    if not settings.asset_cache_dir or settings.asset_cache_max_mb <= 0:
+        return None
+    return AssetCache(settings.asset_cache_dir, settings.asset_cache_max_mb * 1024 * 1024)
@@ -0,0 +1,240 @@
+﻿from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any
+
+from bot.config import Settings
+from bot.services.provider_base import EmojiItem
+from bot.services.tgs_validator import TgsMeta
+from bot.utils.files import ensure_dir, sha256_hex
+
+logger = logging.getLogger(__name__)
+
+JOB_FILE = "job.json"
+ITEMS_FILE = "items.jsonl"
+HOSTNAME = socket.gethostname()
+
+
+@dataclass
+class CheckpointedAsset:
+    data: bytes
+    meta: TgsMeta
+    sha256: str
+
+
+def new_checkpoint_id() -> str:
+    return uuid.uuid4().hex
+
+
+def _write_atomic(path: Path, raw: bytes) -> None:
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as file_handle:
+            file_handle.write(raw)
+        os.replace(tmp_name, path)
+    except OSError:
+        try:
+            os.unlink(tmp_name)
+        except OSError:
+            pass
+        raise
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+class ExportCheckpoint:
+    def __init__(self, path: Path, job: dict[str, Any]) -> None:
+        self.path = path
+        self.id = path.name
+        self.job = job
+        self._lock = threading.Lock()
+        self._records: dict[int, dict[str, Any]] = {}
+        self._load_records()
+
+    @property
+    def payload(self) -> dict[str, Any]:
+        return self.job["payload"]
+
+    @property
+    def status(self) -> str:
+        return self.job["status"]
+
+    @property
+    def user_id(self) -> int:
+        return self.job.get("user_id", 0)
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def _asset_path(self, index: int) -> Path:
+        return self.path / f"{index:04d}.tgs"
+
+    def _load_records(self) -> None:
+        try:
+            lines = (self.path / ITEMS_FILE).read_text(encoding="utf-8").splitlines()
+        except FileNotFoundError:
+            return
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            self._records[record["index"]] = record
+
+    def get(self, index: int, item: EmojiItem) -> CheckpointedAsset | None:
+        record = self._records.get(index)
+        if record is None or record.get("file_unique_id") != item.file_unique_id:
+            return None
+        try:
+            data = self._asset_path(index).read_bytes()
+        except OSError:
+            return None
+        if sha256_hex(data) != record["sha256"]:
+            logger.warning(
+                "dropping corrupt checkpoint asset", extra={"checkpoint": self.id, "index": index}
+            )
+            return None
+        return CheckpointedAsset(
+            data=data, meta=TgsMeta(**record["meta"]), sha256=record["sha256"]
+        )
+
+    def record(self, index: int, item: EmojiItem, data: bytes, meta: TgsMeta) -> None:
+        record = {
+            "index": index,
+            "file_unique_id": item.file_unique_id,
+            "sha256": sha256_hex(data),
+            "meta": asdict(meta),
+        }
+        try:
+            _write_atomic(self._asset_path(index), data)
+            with self._lock:
+                with (self.path / ITEMS_FILE).open("a", encoding="utf-8") as file_handle:
+                    file_handle.write(json.dumps(record) + "\n")
+                self._records[index] = record
+        except OSError as exc:
+            logger.warning(
+                "checkpoint write failed", extra={"checkpoint": self.id, "error": str(exc)}
+            )
+
+    def mark(self, status: str, *, error: str | None = None) -> None:
+        self.job.update(
+            status=status,
+            error=error,
+            host=HOSTNAME,
+            pid=os.getpid(),
+            updated_at=time.time(),
+        )
+        try:
+            _write_atomic(self.path / JOB_FILE, json.dumps(self.job).encode("utf-8"))
+        except OSError as exc:
+            logger.warning(
+                "checkpoint write failed", extra={"checkpoint": self.id, "error": str(exc)}
+            )
+
+    def orphaned(self) -> bool:
+        return (
+            self.status == "running"
+            and self.job.get("host") == HOSTNAME
+            and not _pid_alive(self.job.get("pid", 0))
+        )
+
+    def remove(self) -> None:
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+class CheckpointStore:
+    def __init__(self, root: str | Path, *, ttl_s: float) -> None:
+        self.root = Path(root)
+        self.ttl_s = ttl_s
+        ensure_dir(self.root)
+
+    def _path(self, checkpoint_id: str) -> Path | None:
+        if not checkpoint_id or not checkpoint_id.isalnum():
+            return None
+        return self.root / checkpoint_id
+
+    def open(self, checkpoint_id: str, user_id: int, payload: dict[str, Any]) -> ExportCheckpoint:
+        checkpoint = self.load(checkpoint_id)
+        if checkpoint is None:
+            path = self._path(checkpoint_id)
+            if path is None:
+                raise ValueError(f"invalid checkpoint id: {checkpoint_id!r}")
+            ensure_dir(path)
+            checkpoint = ExportCheckpoint(
+                path, {"user_id": user_id, "payload": payload, "created_at": time.time()}
+            )
+        checkpoint.mark("running")
+        return checkpoint
+
+    def load(self, checkpoint_id: str) -> ExportCheckpoint | None:
+        path = self._path(checkpoint_id)
+        if path is None:
+            return None
+        try:
+            job = json.loads((path / JOB_FILE).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        return ExportCheckpoint(path, job)
+
+    def _expired(self, checkpoint: ExportCheckpoint, now: float) -> bool:
+        return self.ttl_s > 0 and now - checkpoint.job.get("updated_at", 0) > self.ttl_s
+
+    def scan(self) -> list[ExportCheckpoint]:
+        checkpoints: list[ExportCheckpoint] = []
+        now = time.time()
+        for path in self.root.iterdir():
+            checkpoint = self.load(path.name)
+            if checkpoint is None:
+                continue
+            if self._expired(checkpoint, now):
+                checkpoint.remove()
+                continue
+            checkpoints.append(checkpoint)
+        return checkpoints
+
+    def prune(self) -> int:
+        removed = 0
+        now = time.time()
+        for path in self.root.iterdir():
+            checkpoint = self.load(path.name)
+            if checkpoint is not None and self._expired(checkpoint, now):
+                checkpoint.remove()
+                removed += 1
+        return removed
+
+
+async def prune_checkpoints(checkpoints: CheckpointStore, *, interval_s: float) -> None:
+    while True:
+        try:
+            removed = await asyncio.to_thread(checkpoints.prune)
+        except OSError as exc:
+            logger.warning("checkpoint prune failed", extra={"error": str(exc)})
+        else:
+            if removed:
+                logger.info("checkpoints pruned", extra={"removed": removed})
+        await asyncio.sleep(max(1.0, interval_s))
+
+
+def create_checkpoint_store(settings: Settings) -> CheckpointStore | None:
+    if not settings.checkpoint_dir:
+        return None
+    return CheckpointStore(settings.checkpoint_dir, ttl_s=settings.checkpoint_ttl_s)
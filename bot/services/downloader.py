@@ -1,9 +1,14 @@
 ﻿from __future__ import annotations
 
-import asyncio
 import logging
 
-from bot.services.provider_base import DownloadError, EmojiItem, EmojiPackProvider
+from bot.services.provider_base import (
+    DownloadError,
+    EmojiItem,
+    EmojiPackProvider,
+    ProviderError,
+)
+from bot.services.retry_policy import RetryPolicy
 
 
 async def download_with_retry(
@@ -14,19 +19,25 @@ async def download_with_retry(
     backoff_base: float,
     logger: logging.Logger,
 ) -> bytes:
-    last_exc: Exception | None = None
-    for attempt in range(1, retries + 1):
-        try:
-            return await asyncio.wait_for(provider.download_emoji(item), timeout=timeout_s)
-        except Exception as exc:  # noqa: BLE001
-            last_exc = exc
-            if attempt >= retries:
-                break
-            sleep_s = backoff_base * (2 ** (attempt - 1))
-            logger.warning(
-                "download failed, retrying",
-                extra={"attempt": attempt, "sleep_s": sleep_s, "error": str(exc)},
-            )
-            await asyncio.sleep(sleep_s)
+    policy = provider.retry_policy or RetryPolicy(attempts=retries, base_delay_s=backoff_base)
+    hedger = provider.hedger
 
-    raise DownloadError("не удалось скачать файл после нескольких попыток") from last_exc
\ No newline at end of file
+    async def attempt() -> bytes:
+        if hedger is None:
+            return await provider.download_emoji(item)
+        return await hedger.run(lambda: provider.download_emoji(item))
+
+    try:
+        return await policy.call(
+            "download",
+            attempt,
+            timeout_s=timeout_s,
+            attempts=retries,
+        )
+    except (DownloadError, ProviderError):
+        raise
+    except Exception as exc:  # noqa: BLE001
+        logger.warning(
+            "download failed", extra={"custom_emoji_id": item.custom_emoji_id, "error": repr(exc)}
+        )
+        raise DownloadError("не удалось скачать файл после нескольких попыток") from exc
@@ -0,0 +1,90 @@
+﻿from __future__ import annotations
+
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from bot.config import Settings
+from bot.services.provider_base import EmojiItem
+from bot.utils.files import ensure_dir
+
+QUERY_CHUNK = 500
+
+
+class CustomEmojiIndex:
+    def __init__(self, path: str | Path, *, ttl_s: float) -> None:
+        self.path = Path(path)
+        self.ttl_s = ttl_s
+        self._db_lock = threading.Lock()
+
+        ensure_dir(self.path.parent)
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS custom_emoji ("
+            "custom_emoji_id TEXT PRIMARY KEY, file_id TEXT NOT NULL, file_unique_id TEXT, "
+            "file_size INTEGER, updated_at REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def get_many(self, custom_emoji_ids: list[str]) -> dict[str, EmojiItem]:
+        found: dict[str, EmojiItem] = {}
+        min_updated_at = time.time() - self.ttl_s if self.ttl_s > 0 else 0.0
+        for start in range(0, len(custom_emoji_ids), QUERY_CHUNK):
+            chunk = custom_emoji_ids[start : start + QUERY_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            with self._db_lock:
+                rows = self._db.execute(
+                    "SELECT custom_emoji_id, file_id, file_unique_id, file_size FROM custom_emoji "
+                    f"WHERE custom_emoji_id IN ({placeholders}) AND updated_at >= ?",
+                    (*chunk, min_updated_at),
+                ).fetchall()
+            for custom_id, file_id, file_unique_id, file_size in rows:
+                found[custom_id] = EmojiItem(
+                    custom_emoji_id=custom_id,
+                    file_id=file_id,
+                    file_unique_id=file_unique_id,
+                    file_size=file_size,
+                )
+        return found
+
+    def put_many(self, items: list[EmojiItem]) -> None:
+        now = time.time()
+        rows = [
+            (item.custom_emoji_id, item.file_id, item.file_unique_id, item.file_size, now)
+            for item in items
+            if item.file_id
+        ]
+        if not rows:
+            return
+        with self._db_lock:
+            with self._db:
+                self._db.executemany(
+                    "INSERT INTO custom_emoji "
+                    "(custom_emoji_id, file_id, file_unique_id, file_size, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?) ON CONFLICT(custom_emoji_id) DO UPDATE SET "
+                    "file_id = excluded.file_id, file_unique_id = excluded.file_unique_id, "
+                    "file_size = excluded.file_size, updated_at = excluded.updated_at",
+                    rows,
+                )
+
+    def forget(self, custom_emoji_ids: list[str]) -> None:
+        with self._db_lock:
+            with self._db:
+                self._db.executemany(
+                    "DELETE FROM custom_emoji WHERE custom_emoji_id = ?",
+                    [(custom_id,) for custom_id in custom_emoji_ids],
+                )
+
+    def close(self) -> None:
+        with self._db_lock:
+            self._db.close()
+
+
+def create_custom_emoji_index(settings: Settings) -> CustomEmojiIndex | None:
+    if not settings.custom_emoji_index_path:
+        return None
+    return CustomEmojiIndex(
+        settings.custom_emoji_index_path, ttl_s=settings.custom_emoji_index_ttl_s
+    )
@@ -0,0 +1,446 @@
+﻿from __future__ import annotations
+
+import asyncio
+import gzip
+import logging
+import os
+import shutil
+import tempfile
+from collections import Counter
+from contextlib import aclosing
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable
+
+from bot.config import Settings
+from bot.schemas.manifest import ManifestItem, ManifestPack, TgsMeta
+from bot.services.asset_cache import AssetCache, asset_cache_key
+from bot.services.checkpoint import ExportCheckpoint
+from bot.services.downloader import download_with_retry
+from bot.services.manifest_builder import build_manifest, dump_manifest
+from bot.services.metrics import STAGE_SECONDS, cache_lookup
+from bot.services.pipeline import ordered_map
+from bot.services.provider_base import EmojiItem, EmojiPackProvider
+from bot.services.result_cache import ResultCache
+from bot.services.scheduler import ExportScheduler
+from bot.services.tgs_validator import TgsValidationError, TgsValidationResult
+from bot.services.validation_pool import ValidationPool
+from bot.services.zipper import ArchiveWriter, entry_size
+from bot.utils.files import sha256_hex
+from bot.utils.time import utc_now_filename
+
+logger = logging.getLogger(__name__)
+
+ProgressReporter = Callable[..., None]
+
+
+class ExportError(Exception):
+    pass
+
+
+@dataclass
+class PackSection:
+    short_name: str
+    title: str
+    source_url: str
+    size: int
+
+
+@dataclass
+class ExportRequest:
+    items: list[EmojiItem]
+    source_url: str
+    source_pack_name: str
+    pack_title: str
+    pack_short_name: str
+    export_name: str
+    export_format: str
+    result_scope: str | None = None
+    sections: list[PackSection] = field(default_factory=list)
+
+    @property
+    def flight_key(self) -> tuple[str, str]:
+        return (self.result_scope or self.source_url, self.export_format)
+
+
+@dataclass
+class ExportVolume:
+    number: int
+    file_name: str
+    path: Path | None = None
+    data: bytes | None = None
+    file_id: str | None = None
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+
+@dataclass
+class ExportArtifact:
+    file_name: str
+    source_hashes: list[str] = field(default_factory=list)
+    volumes: list[ExportVolume] = field(default_factory=list)
+    workdir: str | None = None
+    done: bool = False
+    error: BaseException | None = None
+    _changed: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+
+    def add_volume(self, volume: ExportVolume) -> None:
+        self.volumes.append(volume)
+        self._notify()
+
+    def finish(self, error: BaseException | None = None) -> None:
+        self.done = True
+        self.error = error
+        self._notify()
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def sealed_volumes(self) -> AsyncIterator[ExportVolume]:
+        index = 0
+        while True:
+            while index < len(self.volumes):
+                yield self.volumes[index]
+                index += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._changed.wait()
+
+    def cleanup(self) -> None:
+        for volume in self.volumes:
+            volume.data = None
+        if self.workdir is not None:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+            self.workdir = None
+
+
+def _no_progress(text: str, *, force: bool = False) -> None:
+    return None
+
+
+def _item_locations(request: ExportRequest) -> list[tuple[str, int]]:
+    if not request.sections:
+        return [("", index) for index in range(len(request.items))]
+    locations: list[tuple[str, int]] = []
+    for section in request.sections:
+        locations.extend((f"{section.short_name}/", index) for index in range(section.size))
+    if len(locations) != len(request.items):
+        raise ExportError("состав наборов не совпадает со списком эмодзи")
+    return locations
+
+
+@dataclass
+class LoadedAsset:
+    data: bytes
+    result: TgsValidationResult
+    downloaded: bool
+
+
+class SharedAssets:
+    def __init__(self, items: list[EmojiItem]) -> None:
+        self._pending = Counter(self.key(item) for item in items)
+        self._shared: dict[str, asyncio.Future[LoadedAsset]] = {}
+        self.reused = 0
+
+    @staticmethod
+    def key(item: EmojiItem) -> str:
+        return item.file_unique_id or item.file_id or item.custom_emoji_id
+
+    def release(self, item: EmojiItem) -> None:
+        key = self.key(item)
+        self._pending[key] -= 1
+        if self._pending[key] <= 0:
+            self._shared.pop(key, None)
+
+    async def load(
+        self,
+        item: EmojiItem,
+        load: Callable[[], Awaitable[LoadedAsset]],
+    ) -> LoadedAsset:
+        key = self.key(item)
+        shared = self._shared.get(key)
+        self.release(item)
+        if shared is not None:
+            self.reused += 1
+            return await asyncio.shield(shared)
+        if self._pending[key] <= 0:
+            return await load()
+
+        future: asyncio.Future[LoadedAsset] = asyncio.get_running_loop().create_future()
+        self._shared[key] = future
+        try:
+            result = await load()
+        except BaseException as exc:
+            self._shared.pop(key, None)
+            if isinstance(exc, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(exc)
+                future.exception()
+            raise
+        future.set_result(result)
+        return result
+
+
+async def build_export(
+    request: ExportRequest,
+    *,
+    config: Settings,
+    provider: EmojiPackProvider,
+    report: ProgressReporter = _no_progress,
+    asset_cache: AssetCache | None = None,
+    result_cache: ResultCache | None = None,
+    validator: ValidationPool | None = None,
+    scheduler: ExportScheduler | None = None,
+    publish: Callable[[ExportArtifact], None] | None = None,
+    checkpoint: ExportCheckpoint | None = None,
+) -> ExportArtifact:
+    validator = validator or ValidationPool()
+
+    async def show_queue_position(position: int) -> None:
+        report(f"в очереди на экспорт: {position}…", force=True)
+
+    if scheduler is not None:
+        await scheduler.acquire(request.flight_key, on_position=show_queue_position)
+    try:
+        return await _run_pipeline(
+            request,
+            config=config,
+            provider=provider,
+            report=report,
+            asset_cache=asset_cache,
+            result_cache=result_cache,
+            validator=validator,
+            publish=publish,
+            checkpoint=checkpoint,
+        )
+    finally:
+        if scheduler is not None:
+            scheduler.release()
+
+
+async def _run_pipeline(
+    request: ExportRequest,
+    *,
+    config: Settings,
+    provider: EmojiPackProvider,
+    report: ProgressReporter,
+    asset_cache: AssetCache | None,
+    result_cache: ResultCache | None,
+    validator: ValidationPool,
+    publish: Callable[[ExportArtifact], None] | None = None,
+    checkpoint: ExportCheckpoint | None = None,
+) -> ExportArtifact:
+    export_format = request.export_format
+    items = request.items
+    volume_limit_bytes = config.max_total_zip_mb * 1024 * 1024
+    max_volumes = max(1, config.max_volumes) if config.multi_volume else 1
+    items_manifest: list[ManifestItem] = []
+    item_volumes: list[int] = []
+
+    shared_assets = SharedAssets(items)
+    locations = _item_locations(request)
+
+    async def load_asset(item: EmojiItem) -> LoadedAsset:
+        cache_key = asset_cache_key(item)
+        if asset_cache is not None:
+            cached = await asyncio.to_thread(asset_cache.get, cache_key)
+            cache_lookup("asset", cached is not None)
+            if cached is not None:
+                json_bytes = b""
+                if export_format == "json":
+                    json_bytes = await asyncio.to_thread(gzip.decompress, cached.data)
+                result = TgsValidationResult(meta=cached.meta, json_bytes=json_bytes)
+                return LoadedAsset(data=cached.data, result=result, downloaded=False)
+
+        data = await download_with_retry(
+            provider=provider,
+            item=item,
+            timeout_s=config.download_timeout,
+            retries=config.download_retries,
+            backoff_base=config.retry_backoff_base,
+            logger=logger,
+        )
+        try:
+            with STAGE_SECONDS.time(stage="validate_tgs"):
+                result = await validator.validate(data, json_output=export_format == "json")
+        except TgsValidationError as exc:
+            raise ExportError(f"ошибка в tgs: {exc}") from exc
+        if asset_cache is not None:
+            await asyncio.to_thread(asset_cache.put, cache_key, data, result.meta)
+        return LoadedAsset(data=data, result=result, downloaded=True)
+
+    async def fetch(
+        index: int, item: EmojiItem
+    ) -> tuple[int, EmojiItem, bytes, TgsValidationResult]:
+        if checkpoint is not None:
+            saved = await asyncio.to_thread(checkpoint.get, index, item)
+            if saved is not None:
+                shared_assets.release(item)
+                json_bytes = b""
+                if export_format == "json":
+                    json_bytes = await asyncio.to_thread(gzip.decompress, saved.data)
+                result = TgsValidationResult(meta=saved.meta, json_bytes=json_bytes)
+                return index, item, saved.data, result
+
+        asset = await shared_assets.load(item, lambda: load_asset(item))
+        if checkpoint is not None and asset.downloaded:
+            await asyncio.to_thread(checkpoint.record, index, item, asset.data, asset.result.meta)
+        return index, item, asset.data, asset.result
+
+    zip_stem = f"export_{request.export_name}_{utc_now_filename()}"
+    spool_bytes = config.archive_spool_mb * 1024 * 1024
+    offload_bytes = config.archive_offload_kb * 1024
+    workdir = tempfile.mkdtemp(prefix="export_")
+    artifact = ExportArtifact(file_name=f"{zip_stem}.zip", workdir=workdir)
+    source_hashes = artifact.source_hashes
+    if publish is not None:
+        publish(artifact)
+
+    def open_volume(number: int) -> ArchiveWriter:
+        return ArchiveWriter(
+            os.path.join(workdir, f"volume_{number:03d}.zip"),
+            max_memory_bytes=spool_bytes,
+            deflate_level=config.archive_deflate_level,
+        )
+
+    def seal_volume(archive: ArchiveWriter, number: int, *, final: bool) -> ExportVolume:
+        archive.close()
+        file_name = artifact.file_name if final and number == 1 else f"{zip_stem}.part{number}.zip"
+        return ExportVolume(
+            number=number,
+            file_name=file_name,
+            path=archive.path,
+            data=None if archive.path is not None else archive.getvalue(),
+        )
+
+    def render_manifest() -> bytes:
+        multi_volume = volume_number > 1
+        for manifest_item, number in zip(items_manifest, item_volumes):
+            manifest_item.volume = number if multi_volume else None
+        manifest = build_manifest(
+            source_url=request.source_url,
+            source_pack_name=request.source_pack_name,
+            pack_title=request.pack_title,
+            pack_short_name=request.pack_short_name,
+            items=items_manifest,
+            volumes=volume_number if multi_volume else None,
+            packs=[
+                ManifestPack(
+                    title=section.title,
+                    short_name=section.short_name,
+                    emoji_count=section.size,
+                    url=section.source_url,
+                )
+                for section in request.sections
+            ]
+            or None,
+        )
+        return dump_manifest(manifest).encode("utf-8")
+
+    volume_number = 1
+    archive = open_volume(volume_number)
+    try:
+        total = len(items)
+
+        if checkpoint is not None and len(checkpoint):
+            report(f"продолжаю экспорт: {len(checkpoint)}/{total} уже скачано…", force=True)
+        else:
+            report(f"скачиваю (0/{total})…")
+
+        fetched = ordered_map(
+            items,
+            fetch,
+            concurrency=config.download_concurrency,
+            buffer=config.pipeline_buffer,
+        )
+        async with aclosing(fetched):
+            async for index, item, data, result in fetched:
+                report(f"скачиваю ({index + 1}/{total})…")
+
+                if export_format == "json":
+                    payload = result.json_bytes
+                    ext = "json"
+                    mime = "application/json"
+                else:
+                    payload = data
+                    ext = "tgs"
+                    mime = "application/x-tgsticker"
+
+                directory, pack_index = locations[index]
+                file_name = f"{directory}assets/{pack_index:04d}.{ext}"
+                if archive.size + entry_size(file_name, payload) > volume_limit_bytes:
+                    if not archive.entries or volume_number >= max_volumes:
+                        raise ExportError("превышен лимит размера архива")
+                    with STAGE_SECONDS.time(stage="zip"):
+                        sealed = seal_volume(archive, volume_number, final=False)
+                    artifact.add_volume(sealed)
+                    volume_number += 1
+                    archive = open_volume(volume_number)
+
+                payload_sha256 = sha256_hex(payload)
+                source_hashes.append(payload_sha256 if payload is data else sha256_hex(data))
+
+                with STAGE_SECONDS.time(stage="zip"):
+                    await archive.add_async(file_name, payload, offload_bytes=offload_bytes)
+
+                items_manifest.append(
+                    ManifestItem(
+                        index=pack_index,
+                        custom_emoji_id=item.custom_emoji_id,
+                        pack=directory.rstrip("/") or None,
+                        file_name=file_name,
+                        mime=mime,
+                        sha256=payload_sha256,
+                        tgs_meta=TgsMeta(
+                            w=result.meta.w,
+                            h=result.meta.h,
+                            fr=result.meta.fr,
+                            ip=result.meta.ip,
+                            op=result.meta.op,
+                        ),
+                    )
+                )
+                item_volumes.append(volume_number)
+
+        report("собираю архив…")
+
+        with STAGE_SECONDS.time(stage="manifest"):
+            manifest_bytes = render_manifest()
+        if archive.size + entry_size("manifest.json", manifest_bytes) > volume_limit_bytes:
+            if volume_number >= max_volumes:
+                raise ExportError("превышен лимит размера архива")
+            with STAGE_SECONDS.time(stage="zip"):
+                sealed = seal_volume(archive, volume_number, final=False)
+            artifact.add_volume(sealed)
+            volume_number += 1
+            archive = open_volume(volume_number)
+            with STAGE_SECONDS.time(stage="manifest"):
+                manifest_bytes = render_manifest()
+        with STAGE_SECONDS.time(stage="zip"):
+            await archive.add_async("manifest.json", manifest_bytes, offload_bytes=offload_bytes)
+            final_volume = seal_volume(archive, volume_number, final=True)
+        if result_cache is not None and request.result_scope is not None and volume_number == 1:
+            cached = result_cache.get(request.result_scope, export_format, source_hashes)
+            if cached is not None and len(cached.file_ids) == 1:
+                final_volume.file_id = cached.file_ids[0]
+        artifact.add_volume(final_volume)
+        artifact.finish()
+    except BaseException as exc:
+        if not archive.closed:
+            archive.discard()
+        if isinstance(exc, asyncio.CancelledError):
+            artifact.finish(ExportError("экспорт отменён"))
+        else:
+            artifact.finish(exc)
+        if publish is None:
+            artifact.cleanup()
+        raise
+
+    if shared_assets.reused:
+        logger.info("shared assets reused", extra={"reused": shared_assets.reused})
+    if asset_cache is not None:
+        logger.info("export built", extra={"asset_cache": asset_cache.stats()})
+    return artifact
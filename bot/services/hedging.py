@@ -0,0 +1,120 @@
+﻿from __future__ import annotations
+
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Awaitable, Callable, TypeVar
+
+from bot.config import Settings
+from bot.services.metrics import DOWNLOAD_SECONDS, HEDGE_THRESHOLD, HEDGES
+from bot.services.retry_policy import RetryBudget
+
+T = TypeVar("T")
+
+HEDGE_MIN_SAMPLES = 20
+
+
+class LatencyTracker:
+    def __init__(self, *, window: int, min_samples: int = HEDGE_MIN_SAMPLES) -> None:
+        self.min_samples = max(1, min_samples)
+        self._samples: deque[float] = deque(maxlen=max(self.min_samples, window))
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def observe(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def quantile(self, q: float) -> float | None:
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))
+        return ordered[index]
+
+
+class Hedger:
+    def __init__(
+        self,
+        *,
+        quantile: float,
+        min_delay_s: float,
+        max_delay_s: float,
+        tracker: LatencyTracker,
+        budget: RetryBudget | None = None,
+    ) -> None:
+        self.quantile = min(max(quantile, 0.5), 0.999)
+        self.min_delay_s = max(0.0, min_delay_s)
+        self.max_delay_s = max(self.min_delay_s, max_delay_s)
+        self.tracker = tracker
+        self.budget = budget
+
+    def threshold(self) -> float | None:
+        observed = self.tracker.quantile(self.quantile)
+        if observed is None:
+            return None
+        threshold = min(self.max_delay_s, max(self.min_delay_s, observed))
+        HEDGE_THRESHOLD.set(threshold)
+        return threshold
+
+    async def _attempt(self, fn: Callable[[], Awaitable[T]]) -> T:
+        started = time.perf_counter()
+        result = await fn()
+        self.tracker.observe(time.perf_counter() - started)
+        return result
+
+    async def run(self, fn: Callable[[], Awaitable[T]]) -> T:
+        started = time.perf_counter()
+        if self.budget is not None:
+            self.budget.deposit()
+
+        primary = asyncio.ensure_future(self._attempt(fn))
+        tasks = [primary]
+        outcome = "primary"
+        try:
+            threshold = self.threshold()
+            if threshold is not None:
+                done, _ = await asyncio.wait({primary}, timeout=threshold)
+                if not done:
+                    if self.budget is None or self.budget.withdraw():
+                        HEDGES.inc(result="sent")
+                        tasks.append(asyncio.ensure_future(self._attempt(fn)))
+                    else:
+                        HEDGES.inc(result="capped")
+
+            pending = set(tasks)
+            error: BaseException | None = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = error or task.exception()
+                        continue
+                    if len(tasks) > 1:
+                        won = task is not primary
+                        HEDGES.inc(result="won" if won else "lost")
+                        outcome = "hedge_won" if won else "primary_won"
+                    DOWNLOAD_SECONDS.observe(time.perf_counter() - started, outcome=outcome)
+                    return task.result()
+            assert error is not None
+            raise error
+        finally:
+            if not primary.done():
+                self.tracker.observe(time.perf_counter() - started)
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def create_hedger(settings: Settings) -> Hedger | None:
+    if settings.hedge_max_ratio <= 0:
+        return None
+    return Hedger(
+        quantile=settings.hedge_quantile,
+        min_delay_s=settings.hedge_min_delay,
+        max_delay_s=settings.download_timeout / 2,
+        tracker=LatencyTracker(window=settings.hedge_window),
+        budget=RetryBudget(ratio=settings.hedge_max_ratio, min_per_s=0, capacity=10),
+    )
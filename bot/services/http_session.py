@@ -0,0 +1,161 @@
+﻿from __future__ import annotations
+
+import asyncio
+import os
+import time
+from contextlib import aclosing
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any
+
+from aiogram import Bot, __version__ as aiogram_version
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiohttp import ClientSession, TraceConfig, TraceConnectionCreateEndParams
+from aiohttp import TraceConnectionReuseconnParams, TraceRequestStartParams
+from aiohttp.hdrs import USER_AGENT
+from aiohttp.http import SERVER_SOFTWARE
+
+from bot.config import Settings
+from bot.services.provider_base import FileTooLargeError
+
+DOWNLOAD_CHUNK_BYTES = 64 * 1024
+
+
+class HttpStats:
+    def __init__(self) -> None:
+        self.requests = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+        self.files = 0
+        self.bytes_downloaded = 0
+        self.download_seconds = 0.0
+
+    def trace_config(self) -> TraceConfig:
+        trace = TraceConfig()
+
+        async def on_request_start(
+            _session: ClientSession, _ctx: SimpleNamespace, _params: TraceRequestStartParams
+        ) -> None:
+            self.requests += 1
+
+        async def on_connection_create_end(
+            _session: ClientSession, _ctx: SimpleNamespace, _params: TraceConnectionCreateEndParams
+        ) -> None:
+            self.connections_created += 1
+
+        async def on_connection_reuseconn(
+            _session: ClientSession, _ctx: SimpleNamespace, _params: TraceConnectionReuseconnParams
+        ) -> None:
+            self.connections_reused += 1
+
+        trace.on_request_start.append(on_request_start)
+        trace.on_connection_create_end.append(on_connection_create_end)
+        trace.on_connection_reuseconn.append(on_connection_reuseconn)
+        return trace
+
+    def record_download(self, size: int, seconds: float) -> None:
+        self.files += 1
+        self.bytes_downloaded += size
+        self.download_seconds += seconds
+
+    def snapshot(self) -> dict[str, Any]:
+        connections = self.connections_created + self.connections_reused
+        return {
+            "requests": self.requests,
+            "connections_created": self.connections_created,
+            "connections_reused": self.connections_reused,
+            "reuse_ratio": round(self.connections_reused / connections, 3) if connections else 0.0,
+            "files": self.files,
+            "bytes_downloaded": self.bytes_downloaded,
+            "bytes_per_s": (
+                round(self.bytes_downloaded / self.download_seconds)
+                if self.download_seconds
+                else 0
+            ),
+        }
+
+
+class TunedAiohttpSession(AiohttpSession):
+    def __init__(
+        self,
+        *,
+        limit: int,
+        limit_per_host: int,
+        dns_ttl_s: int,
+        keepalive_s: float,
+        stats: HttpStats | None = None,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(limit=limit, **kwargs)
+        self._connector_init.update(
+            limit_per_host=limit_per_host,
+            ttl_dns_cache=dns_ttl_s,
+            keepalive_timeout=keepalive_s,
+        )
+        self.stats = stats or HttpStats()
+
+    async def create_session(self) -> ClientSession:
+        if self._should_reset_connector:
+            await self.close()
+
+        if self._session is None or self._session.closed:
+            self._session = ClientSession(
+                connector=self._connector_type(**self._connector_init),
+                headers={USER_AGENT: f"{SERVER_SOFTWARE} aiogram/{aiogram_version}"},
+                trace_configs=[self.stats.trace_config()],
+            )
+            self._should_reset_connector = False
+
+        return self._session
+
+
+async def download_file_bytes(
+    bot: Bot,
+    file_path: str,
+    *,
+    max_bytes: int,
+    timeout_s: int = 30,
+    stats: HttpStats | None = None,
+) -> bytes:
+    started = time.monotonic()
+    api = bot.session.api
+    if api.is_local:
+        local_path = api.wrap_local_file.to_local(file_path)
+        size = await asyncio.to_thread(os.path.getsize, local_path)
+        if size > max_bytes:
+            raise FileTooLargeError(f"файл больше {max_bytes // 1024} КБ")
+        data = await asyncio.to_thread(Path(local_path).read_bytes)
+    else:
+        chunks: list[bytes] = []
+        size = 0
+        stream = bot.session.stream_content(
+            url=api.file_url(bot.token, file_path),
+            timeout=timeout_s,
+            chunk_size=DOWNLOAD_CHUNK_BYTES,
+            raise_for_status=True,
+        )
+        async with aclosing(stream):
+            async for chunk in stream:
+                size += len(chunk)
+                if size > max_bytes:
+                    raise FileTooLargeError(f"файл больше {max_bytes // 1024} КБ")
+                chunks.append(chunk)
+        data = chunks[0] if len(chunks) == 1 else b"".join(chunks)
+
+    if stats is not None:
+        stats.record_download(len(data), time.monotonic() - started)
+    return data
+
+
+def create_bot_session(settings: Settings) -> TunedAiohttpSession:
+    kwargs: dict[str, Any] = {}
+    if settings.telegram_api_base:
+        kwargs["api"] = TelegramAPIServer.from_base(settings.telegram_api_base)
+    return TunedAiohttpSession(
+        limit=settings.http_pool_limit,
+        limit_per_host=settings.http_pool_limit_per_host,
+        dns_ttl_s=settings.http_dns_ttl,
+        keepalive_s=settings.http_keepalive,
+        **kwargs,
+    )
@@ -0,0 +1,186 @@
+﻿from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from bot.config import Settings
+from bot.utils.files import ensure_dir
+
+logger = logging.getLogger(__name__)
+
+FAILED_RETENTION_S = 86400.0
+
+
+@dataclass
+class QueuedJob:
+    id: int
+    user_id: int
+    payload: dict[str, Any]
+    attempts: int
+
+
+class JobQueue(ABC):
+    @abstractmethod
+    async def enqueue(self, user_id: int, payload: dict[str, Any]) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def claim(self, worker_id: str, lease_s: float) -> QueuedJob | None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def heartbeat(self, job_id: int, worker_id: str, lease_s: float) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def complete(self, job_id: int, worker_id: str) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def fail(self, job_id: int, worker_id: str, error: str) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def active_for_user(self, user_id: int) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    def depth(self) -> int:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        return None
+
+
+class SqliteJobQueue(JobQueue):
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        self._db_lock = threading.Lock()
+
+        ensure_dir(self.path.parent)
+        self._db = sqlite3.connect(
+            self.path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS export_jobs ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, "
+            "status TEXT NOT NULL, payload TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, "
+            "worker_id TEXT, lease_until REAL, error TEXT, "
+            "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS export_jobs_status ON export_jobs (status, id)"
+        )
+
+    def _enqueue(self, user_id: int, payload: dict[str, Any]) -> int:
+        now = time.time()
+        with self._db_lock:
+            cursor = self._db.execute(
+                "INSERT INTO export_jobs (user_id, status, payload, created_at, updated_at) "
+                "VALUES (?, 'queued', ?, ?, ?)",
+                (user_id, json.dumps(payload), now, now),
+            )
+        return int(cursor.lastrowid)
+
+    def _claim(self, worker_id: str, lease_s: float) -> QueuedJob | None:
+        now = time.time()
+        with self._db_lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT id, user_id, payload, attempts FROM export_jobs "
+                    "WHERE status = 'queued' OR (status = 'running' AND lease_until < ?) "
+                    "ORDER BY id LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row is not None:
+                    self._db.execute(
+                        "UPDATE export_jobs SET status = 'running', worker_id = ?, "
+                        "lease_until = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                        (worker_id, now + lease_s, now, row[0]),
+                    )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        job_id, user_id, payload, attempts = row
+        return QueuedJob(id=job_id, user_id=user_id, payload=json.loads(payload), attempts=attempts + 1)
+
+    def _heartbeat(self, job_id: int, worker_id: str, lease_s: float) -> bool:
+        now = time.time()
+        with self._db_lock:
+            cursor = self._db.execute(
+                "UPDATE export_jobs SET lease_until = ?, updated_at = ? "
+                "WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (now + lease_s, now, job_id, worker_id),
+            )
+        return cursor.rowcount == 1
+
+    def _complete(self, job_id: int, worker_id: str) -> None:
+        with self._db_lock:
+            self._db.execute(
+                "DELETE FROM export_jobs WHERE id = ? AND worker_id = ?", (job_id, worker_id)
+            )
+
+    def _fail(self, job_id: int, worker_id: str, error: str) -> None:
+        now = time.time()
+        with self._db_lock:
+            self._db.execute(
+                "UPDATE export_jobs SET status = 'failed', error = ?, lease_until = NULL, "
+                "updated_at = ? WHERE id = ? AND worker_id = ?",
+                (error, now, job_id, worker_id),
+            )
+            self._db.execute(
+                "DELETE FROM export_jobs WHERE status = 'failed' AND updated_at < ?",
+                (now - FAILED_RETENTION_S,),
+            )
+
+    async def enqueue(self, user_id: int, payload: dict[str, Any]) -> int:
+        return await asyncio.to_thread(self._enqueue, user_id, payload)
+
+    async def claim(self, worker_id: str, lease_s: float) -> QueuedJob | None:
+        return await asyncio.to_thread(self._claim, worker_id, lease_s)
+
+    async def heartbeat(self, job_id: int, worker_id: str, lease_s: float) -> bool:
+        return await asyncio.to_thread(self._heartbeat, job_id, worker_id, lease_s)
+
+    async def complete(self, job_id: int, worker_id: str) -> None:
+        await asyncio.to_thread(self._complete, job_id, worker_id)
+
+    async def fail(self, job_id: int, worker_id: str, error: str) -> None:
+        await asyncio.to_thread(self._fail, job_id, worker_id, error)
+
+    def active_for_user(self, user_id: int) -> int:
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT COUNT(*) FROM export_jobs "
+                "WHERE user_id = ? AND status IN ('queued', 'running')",
+                (user_id,),
+            ).fetchone()
+        return int(row[0])
+
+    def depth(self) -> int:
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT COUNT(*) FROM export_jobs WHERE status = 'queued'"
+            ).fetchone()
+        return int(row[0])
+
+    async def close(self) -> None:
+        with self._db_lock:
+            self._db.close()
+
+
+def create_job_queue(settings: Settings) -> JobQueue:
+    return SqliteJobQueue(settings.job_queue_path)
@@ -1,7 +1,6 @@
 ﻿from __future__ import annotations
 
 import json
-from pathlib import Path
 
 from bot.schemas.manifest import Manifest, ManifestItem, ManifestPack, ManifestSource
 from bot.utils.time import utc_now_iso
@@ -14,11 +13,13 @@ def build_manifest(
     pack_title: str,
     pack_short_name: str,
     items: list[ManifestItem],
+    volumes: int | None = None,
+    packs: list[ManifestPack] | None = None,
 ) -> Manifest:
     return Manifest(
         exported_at=utc_now_iso(),
         source=ManifestSource(
-            type="telegram_addemoji",
+            type="telegram_addemoji_batch" if packs else "telegram_addemoji",
             url=source_url,
             pack_name=source_pack_name,
         ),
@@ -27,12 +28,11 @@ def build_manifest(
             short_name=pack_short_name,
             emoji_count=len(items),
         ),
+        volumes=volumes,
+        packs=packs,
         items=items,
     )
 
 
-def write_manifest(manifest: Manifest, path: str | Path) -> None:
-    Path(path).write_text(
-        json.dumps(manifest.model_dump(), ensure_ascii=False, indent=2),
-        encoding="utf-8",
-    )
+def dump_manifest(manifest: Manifest) -> str:
+    return json.dumps(manifest.model_dump(exclude_none=True), ensure_ascii=False, indent=2)
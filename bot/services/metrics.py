@@ -0,0 +1,245 @@
+﻿from __future__ import annotations
+
+import logging
+import math
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, TypeVar
+
+from aiohttp import web
+
+from bot.config import Settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelKey = tuple[str, ...]
+M = TypeVar("M", bound="_Metric")
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: LabelKey, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(
+        self, registry: MetricsRegistry, name: str, help_text: str, labelnames: tuple[str, ...]
+    ) -> None:
+        self.registry = registry
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self._values: dict[LabelKey, float] = {}
+
+    def _key(self, labels: dict[str, str]) -> LabelKey:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        if not self.registry.enabled:
+            return
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+    _function: Callable[[], float] | None = None
+
+    def set(self, value: float, **labels: str) -> None:
+        if self.registry.enabled:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self._function = function
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        if self._function is not None:
+            lines.append(f"{self.name} {_format_value(self._function())}")
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        registry: MetricsRegistry,
+        name: str,
+        help_text: str,
+        labelnames: tuple[str, ...],
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(registry, name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._counts: dict[LabelKey, list[int]] = {}
+        self._sums: dict[LabelKey, float] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        if not self.registry.enabled:
+            return
+        key = self._key(labels)
+        counts = self._counts.get(key)
+        if counts is None:
+            counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+            self._sums[key] = 0.0
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[index] += 1
+                break
+        else:
+            counts[-1] += 1
+        self._sums[key] += value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        if not self.registry.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        for key, counts in sorted(self._counts.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}"
+                )
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(self._sums[key])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self, *, enabled: bool = False) -> None:
+        self.enabled = enabled
+        self._metrics: list[_Metric] = []
+
+    def counter(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(self, name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(self, name, help_text, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(self, name, help_text, labelnames, buckets=buckets))
+
+    def _register(self, metric: M) -> M:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "emoji_export_stage_seconds", "Duration of export stages and Bot API calls", ("stage",)
+)
+JOB_SECONDS = REGISTRY.histogram(
+    "emoji_export_job_seconds", "End-to-end export duration", ("format", "result")
+)
+RETRIES = REGISTRY.counter(
+    "emoji_export_retries_total", "Operations retried after a failure", ("operation",)
+)
+RETRY_AFTER = REGISTRY.counter(
+    "emoji_export_retry_after_total", "TelegramRetryAfter responses", ("method",)
+)
+RETRY_BUDGET_EXHAUSTED = REGISTRY.counter(
+    "emoji_export_retry_budget_exhausted_total",
+    "Retries skipped because the retry budget was empty",
+    ("operation",),
+)
+CIRCUIT_OPEN = REGISTRY.gauge("emoji_export_circuit_open", "1 while the Bot API circuit is open")
+DOWNLOAD_SECONDS = REGISTRY.histogram(
+    "emoji_export_download_seconds",
+    "Effective download latency by hedging outcome",
+    ("outcome",),
+)
+HEDGES = REGISTRY.counter(
+    "emoji_export_hedges_total", "Hedged download requests by result", ("result",)
+)
+HEDGE_THRESHOLD = REGISTRY.gauge(
+    "emoji_export_hedge_threshold_seconds", "Current latency threshold for hedged downloads"
+)
+CACHE_LOOKUPS = REGISTRY.counter(
+    "emoji_export_cache_lookups_total", "Cache lookups by cache and outcome", ("cache", "result")
+)
+QUEUE_DEPTH = REGISTRY.gauge("emoji_export_queue_depth", "Exports waiting for a worker slot")
+IN_FLIGHT = REGISTRY.gauge("emoji_export_in_flight", "Exports holding a worker slot")
+
+
+def cache_lookup(cache: str, hit: bool) -> None:
+    CACHE_LOOKUPS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    async def handle_metrics(_: web.Request) -> web.Response:
+        return web.Response(text=REGISTRY.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("metrics server started", extra={"host": host, "port": port})
+    return runner
+
+
+def configure_metrics(settings: Settings) -> bool:
+    REGISTRY.enabled = settings.metrics_port > 0
+    return REGISTRY.enabled
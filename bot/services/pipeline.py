@@ -0,0 +1,56 @@
+﻿from __future__ import annotations
+
+import asyncio
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Iterable, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+async def ordered_map(
+    items: Iterable[T],
+    func: Callable[[int, T], Awaitable[R]],
+    *,
+    concurrency: int,
+    buffer: int = 0,
+) -> AsyncIterator[R]:
+    concurrency = max(1, concurrency)
+    window = concurrency + max(0, buffer)
+    semaphore = asyncio.Semaphore(concurrency)
+    source = iter(enumerate(items))
+    pending: deque[asyncio.Task[R]] = deque()
+
+    async def run(index: int, item: T) -> R:
+        async with semaphore:
+            return await func(index, item)
+
+    def fill() -> None:
+        while len(pending) < window:
+            try:
+                index, item = next(source)
+            except StopIteration:
+                return
+            pending.append(asyncio.create_task(run(index, item)))
+
+    try:
+        fill()
+        while pending:
+            head = pending[0]
+            if not head.done():
+                running = []
+                for task in pending:
+                    if not task.done():
+                        running.append(task)
+                    elif not task.cancelled() and task.exception() is not None:
+                        raise task.exception()
+                await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                continue
+            pending.popleft()
+            yield head.result()
+            fill()
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
@@ -0,0 +1,60 @@
+﻿from __future__ import annotations
+
+from dataclasses import dataclass
+
+from bot.services.provider_base import EmojiItem, EmojiPackProvider
+
+
+@dataclass
+class ExportPlan:
+    items: int
+    sized_items: int
+    source_bytes: int
+    estimated_bytes: int
+    limit_bytes: int
+
+    @property
+    def fits(self) -> bool:
+        return self.estimated_bytes <= self.limit_bytes
+
+    @property
+    def complete(self) -> bool:
+        return self.sized_items == self.items
+
+
+def estimate_payload_bytes(source_bytes: int, export_format: str, json_ratio: float) -> int:
+    if export_format == "json":
+        return int(source_bytes * json_ratio)
+    return source_bytes
+
+
+def estimate_export(
+    items: list[EmojiItem], *, export_format: str, limit_bytes: int, json_ratio: float
+) -> ExportPlan:
+    sizes = [item.file_size for item in items if item.file_size]
+    source_bytes = sum(sizes)
+    if sizes and len(sizes) < len(items):
+        source_bytes += (source_bytes // len(sizes)) * (len(items) - len(sizes))
+    return ExportPlan(
+        items=len(items),
+        sized_items=len(sizes),
+        source_bytes=source_bytes,
+        estimated_bytes=estimate_payload_bytes(source_bytes, export_format, json_ratio),
+        limit_bytes=limit_bytes,
+    )
+
+
+async def plan_export(
+    items: list[EmojiItem],
+    *,
+    provider: EmojiPackProvider,
+    export_format: str,
+    limit_bytes: int,
+    json_ratio: float,
+    concurrency: int,
+) -> ExportPlan:
+    if any(item.file_size is None for item in items):
+        await provider.resolve_file_info(items, concurrency=concurrency)
+    return estimate_export(
+        items, export_format=export_format, limit_bytes=limit_bytes, json_ratio=json_ratio
+    )
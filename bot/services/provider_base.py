@@ -1,11 +1,15 @@
 ﻿from __future__ import annotations
 
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
-from typing import Any
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any
 
 from bot.config import Settings
 
+if TYPE_CHECKING:
+    from bot.services.hedging import Hedger
+    from bot.services.retry_policy import RetryPolicy
+
 
 class ProviderError(Exception):
     pass
@@ -15,10 +19,21 @@ class DownloadError(Exception):
     pass
 
 
+class FileTooLargeError(DownloadError):
+    pass
+
+
+class CircuitOpenError(ProviderError):
+    pass
+
+
 @dataclass
 class EmojiItem:
     custom_emoji_id: str
     file_id: str | None = None
+    file_unique_id: str | None = None
+    file_size: int | None = None
+    file_path: str | None = None
     document: Any | None = None
 
 
@@ -29,7 +44,16 @@ class EmojiPack:
     items: list[EmojiItem]
 
 
+@dataclass
+class CustomEmojiResolution:
+    items: list[EmojiItem]
+    missing: list[str] = field(default_factory=list)
+
+
 class EmojiPackProvider(ABC):
+    retry_policy: RetryPolicy | None = None
+    hedger: Hedger | None = None
+
     @abstractmethod
     async def get_pack(self, pack_name: str) -> EmojiPack:
         raise NotImplementedError
@@ -38,14 +62,39 @@ class EmojiPackProvider(ABC):
     async def download_emoji(self, item: EmojiItem) -> bytes:
         raise NotImplementedError
 
-    async def get_custom_emoji_items(self, custom_emoji_ids: list[str]) -> list[EmojiItem]:
+    async def resolve_custom_emoji(self, custom_emoji_ids: list[str]) -> CustomEmojiResolution:
         raise ProviderError("получение эмодзи из сообщения не поддерживается этим режимом")
 
+    async def resolve_file_info(self, items: list[EmojiItem], *, concurrency: int = 8) -> None:
+        return None
+
     async def close(self) -> None:
         return None
 
 
 def create_provider(settings: Settings, bot) -> EmojiPackProvider:
+    from bot.services.emoji_index import create_custom_emoji_index
+    from bot.services.hedging import create_hedger
     from bot.services.provider_botapi import BotApiEmojiPackProvider
-
-    return BotApiEmojiPackProvider(bot)
+    from bot.services.provider_cache import CachingEmojiPackProvider
+    from bot.services.retry_policy import create_retry_policy
+
+    provider: EmojiPackProvider = BotApiEmojiPackProvider(
+        bot,
+        max_file_bytes=settings.max_file_mb * 1024 * 1024,
+        download_timeout_s=settings.download_timeout,
+        retry_policy=create_retry_policy(settings),
+        hedger=create_hedger(settings),
+        custom_emoji_concurrency=settings.custom_emoji_concurrency,
+    )
+    index = create_custom_emoji_index(settings)
+    if settings.metadata_cache_ttl > 0 or index is not None:
+        provider = CachingEmojiPackProvider(
+            provider,
+            ttl_s=settings.metadata_cache_ttl,
+            negative_ttl_s=settings.metadata_negative_ttl,
+            max_packs=settings.metadata_cache_size,
+            max_custom_emoji=settings.custom_emoji_cache_size,
+            index=index,
+        )
+    return provider
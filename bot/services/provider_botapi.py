@@ -1,78 +1,177 @@
 ﻿from __future__ import annotations
 
-from io import BytesIO
+import asyncio
+import logging
+from typing import Awaitable, Callable, TypeVar
 
 from aiogram import Bot
-from aiogram.exceptions import TelegramBadRequest
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest
+from aiogram.types import Sticker
+from aiohttp import ClientResponseError
 
-from bot.services.provider_base import EmojiItem, EmojiPack, EmojiPackProvider, ProviderError
+from bot.services.hedging import Hedger
+from bot.services.http_session import download_file_bytes
+from bot.services.metrics import STAGE_SECONDS
+from bot.services.provider_base import (
+    CircuitOpenError,
+    CustomEmojiResolution,
+    EmojiItem,
+    EmojiPack,
+    EmojiPackProvider,
+    FileTooLargeError,
+    ProviderError,
+)
+from bot.services.retry_policy import RetryPolicy
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+CUSTOM_EMOJI_CHUNK = 200
+
+
+def _sticker_item(sticker: Sticker) -> EmojiItem:
+    custom_id = sticker.custom_emoji_id or sticker.file_unique_id or sticker.file_id
+    return EmojiItem(
+        custom_emoji_id=str(custom_id),
+        file_id=sticker.file_id,
+        file_unique_id=sticker.file_unique_id,
+        file_size=sticker.file_size,
+    )
 
 
 class BotApiEmojiPackProvider(EmojiPackProvider):
-    def __init__(self, bot: Bot) -> None:
+    def __init__(
+        self,
+        bot: Bot,
+        *,
+        max_file_bytes: int = 4 * 1024 * 1024,
+        download_timeout_s: int = 30,
+        retry_policy: RetryPolicy | None = None,
+        hedger: Hedger | None = None,
+        custom_emoji_concurrency: int = 4,
+    ) -> None:
         self.bot = bot
+        self.max_file_bytes = max_file_bytes
+        self.download_timeout_s = download_timeout_s
+        self.retry_policy = retry_policy
+        self.hedger = hedger
+        self.custom_emoji_concurrency = max(1, custom_emoji_concurrency)
+
+    async def _call(
+        self, stage: str, fn: Callable[[], Awaitable[T]], *, attempts: int | None = None
+    ) -> T:
+        async def timed() -> T:
+            with STAGE_SECONDS.time(stage=stage):
+                return await fn()
+
+        if self.retry_policy is None:
+            return await timed()
+        return await self.retry_policy.call(stage, timed, attempts=attempts)
 
     async def get_pack(self, pack_name: str) -> EmojiPack:
         try:
-            sticker_set = await self.bot.get_sticker_set(name=pack_name)
+            sticker_set = await self._call(
+                "get_sticker_set", lambda: self.bot.get_sticker_set(name=pack_name)
+            )
         except TelegramBadRequest as exc:
             raise ProviderError(
                 "не удалось получить набор через Bot API (проверьте pack_name)"
             ) from exc
 
-        items: list[EmojiItem] = []
-        for sticker in sticker_set.stickers:
-            if not sticker.file_id:
-                continue
-            custom_id = (
-                sticker.custom_emoji_id
-                if sticker.custom_emoji_id
-                else (sticker.file_unique_id or sticker.file_id)
-            )
-            items.append(EmojiItem(custom_emoji_id=str(custom_id), file_id=sticker.file_id))
-
         return EmojiPack(
             title=sticker_set.title,
             short_name=sticker_set.name,
-            items=items,
+            items=[_sticker_item(sticker) for sticker in sticker_set.stickers if sticker.file_id],
         )
 
-    async def get_custom_emoji_items(self, custom_emoji_ids: list[str]) -> list[EmojiItem]:
-        if not custom_emoji_ids:
-            return []
-        try:
-            stickers = await self.bot.get_custom_emoji_stickers(custom_emoji_ids=custom_emoji_ids)
-        except TelegramBadRequest as exc:
-            raise ProviderError("не удалось получить эмодзи по id") from exc
-
-        by_id: dict[str, EmojiItem] = {}
-        for sticker in stickers:
-            if not sticker.file_id:
-                continue
-            custom_id = (
-                sticker.custom_emoji_id
-                if sticker.custom_emoji_id
-                else (sticker.file_unique_id or sticker.file_id)
-            )
-            by_id[str(custom_id)] = EmojiItem(custom_emoji_id=str(custom_id), file_id=sticker.file_id)
+    async def resolve_custom_emoji(self, custom_emoji_ids: list[str]) -> CustomEmojiResolution:
+        found: dict[str, EmojiItem] = {}
+        semaphore = asyncio.Semaphore(self.custom_emoji_concurrency)
 
-        items: list[EmojiItem] = []
-        for custom_id in custom_emoji_ids:
-            item = by_id.get(str(custom_id))
-            if not item:
-                raise ProviderError("не удалось получить данные по части эмодзи")
-            items.append(item)
+        async def fetch(chunk: list[str]) -> None:
+            try:
+                async with semaphore:
+                    stickers = await self._call(
+                        "get_custom_emoji_stickers",
+                        lambda: self.bot.get_custom_emoji_stickers(custom_emoji_ids=chunk),
+                    )
+            except TelegramBadRequest:
+                if len(chunk) == 1:
+                    return
+                middle = len(chunk) // 2
+                await asyncio.gather(fetch(chunk[:middle]), fetch(chunk[middle:]))
+                return
+            except CircuitOpenError:
+                raise
+            except (TelegramAPIError, ProviderError) as exc:
+                logger.warning(
+                    "custom emoji chunk failed", extra={"ids": len(chunk), "error": repr(exc)}
+                )
+                return
+            for sticker in stickers:
+                if sticker.file_id:
+                    item = _sticker_item(sticker)
+                    found[item.custom_emoji_id] = item
 
-        return items
+        chunks = [
+            custom_emoji_ids[start : start + CUSTOM_EMOJI_CHUNK]
+            for start in range(0, len(custom_emoji_ids), CUSTOM_EMOJI_CHUNK)
+        ]
+        await asyncio.gather(*(fetch(chunk) for chunk in chunks))
+
+        resolution = CustomEmojiResolution(items=[])
+        for custom_id in custom_emoji_ids:
+            item = found.get(str(custom_id))
+            if item is None:
+                resolution.missing.append(custom_id)
+            else:
+                resolution.items.append(item)
+        return resolution
 
     async def download_emoji(self, item: EmojiItem) -> bytes:
         if not item.file_id:
             raise ProviderError("отсутствует file_id для скачивания")
 
-        file = await self.bot.get_file(item.file_id)
-        if not file.file_path:
-            raise ProviderError("не удалось получить file_path для файла")
+        if not item.file_path:
+            with STAGE_SECONDS.time(stage="get_file"):
+                file = await self.bot.get_file(item.file_id)
+            if not file.file_path:
+                raise ProviderError("не удалось получить file_path для файла")
+            item.file_path = file.file_path
+            item.file_size = file.file_size or item.file_size
+
+        if item.file_size and item.file_size > self.max_file_bytes:
+            raise FileTooLargeError(f"файл больше {self.max_file_bytes // 1024} КБ")
+
+        try:
+            with STAGE_SECONDS.time(stage="download"):
+                return await download_file_bytes(
+                    self.bot,
+                    item.file_path,
+                    max_bytes=self.max_file_bytes,
+                    timeout_s=self.download_timeout_s,
+                    stats=getattr(self.bot.session, "stats", None),
+                )
+        except ClientResponseError:
+            item.file_path = None
+            raise
+
+    async def resolve_file_info(self, items: list[EmojiItem], *, concurrency: int = 8) -> None:
+        pending = [item for item in items if item.file_id and item.file_size is None]
+        if not pending:
+            return
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def resolve(item: EmojiItem) -> None:
+            async with semaphore:
+                try:
+                    file = await self._call(
+                        "get_file", lambda: self.bot.get_file(item.file_id), attempts=1
+                    )
+                except (TelegramAPIError, ProviderError):
+                    return
+            item.file_path = file.file_path
+            item.file_size = file.file_size
 
-        buffer = BytesIO()
-        await self.bot.download_file(file.file_path, destination=buffer)
-        return buffer.getvalue()
\ No newline at end of file
+        await asyncio.gather(*(resolve(item) for item in pending))
\ No newline at end of file
@@ -0,0 +1,138 @@
+﻿from __future__ import annotations
+
+import asyncio
+from dataclasses import replace
+
+from bot.services.emoji_index import CustomEmojiIndex
+from bot.services.hedging import Hedger
+from bot.services.metrics import cache_lookup
+from bot.services.provider_base import (
+    CircuitOpenError,
+    CustomEmojiResolution,
+    EmojiItem,
+    EmojiPack,
+    EmojiPackProvider,
+    ProviderError,
+)
+from bot.services.retry_policy import RetryPolicy
+from bot.services.ttl_cache import TTLCache
+
+
+class CachingEmojiPackProvider(EmojiPackProvider):
+    def __init__(
+        self,
+        inner: EmojiPackProvider,
+        *,
+        ttl_s: float,
+        negative_ttl_s: float,
+        max_packs: int,
+        max_custom_emoji: int,
+        index: CustomEmojiIndex | None = None,
+    ) -> None:
+        self.inner = inner
+        self.index = index
+        self.negative_ttl_s = negative_ttl_s
+        self._packs: TTLCache[str, EmojiPack | ProviderError] = TTLCache(
+            ttl_s=ttl_s, max_size=max_packs
+        )
+        self._custom_emoji: TTLCache[str, EmojiItem] = TTLCache(
+            ttl_s=ttl_s, max_size=max_custom_emoji
+        )
+
+    @property
+    def retry_policy(self) -> RetryPolicy | None:
+        return self.inner.retry_policy
+
+    @property
+    def hedger(self) -> Hedger | None:
+        return self.inner.hedger
+
+    @staticmethod
+    def _pack_key(pack_name: str) -> str:
+        return pack_name.lower()
+
+    async def get_pack(self, pack_name: str) -> EmojiPack:
+        key = self._pack_key(pack_name)
+        cached = self._packs.get(key)
+        cache_lookup("pack", cached is not None)
+        if isinstance(cached, ProviderError):
+            raise ProviderError(str(cached))
+        if cached is None:
+            try:
+                cached = await self.inner.get_pack(pack_name)
+            except CircuitOpenError:
+                raise
+            except ProviderError as exc:
+                self._packs.set(key, exc, ttl_s=self.negative_ttl_s)
+                raise
+            self._packs.set(key, cached)
+        return EmojiPack(
+            title=cached.title,
+            short_name=cached.short_name,
+            items=[replace(item) for item in cached.items],
+        )
+
+    async def resolve_custom_emoji(self, custom_emoji_ids: list[str]) -> CustomEmojiResolution:
+        found: dict[str, EmojiItem] = {}
+        missing: list[str] = []
+        for custom_id in custom_emoji_ids:
+            item = self._custom_emoji.get(custom_id)
+            cache_lookup("custom_emoji", item is not None)
+            if item is None:
+                missing.append(custom_id)
+            else:
+                found[custom_id] = item
+
+        if missing and self.index is not None:
+            indexed = await asyncio.to_thread(self.index.get_many, missing)
+            for custom_id in missing:
+                cache_lookup("custom_emoji_index", custom_id in indexed)
+            for custom_id, item in indexed.items():
+                self._custom_emoji.set(custom_id, item)
+                found[custom_id] = item
+            missing = [custom_id for custom_id in missing if custom_id not in indexed]
+
+        unresolved: list[str] = []
+        if missing:
+            resolution = await self.inner.resolve_custom_emoji(missing)
+            for item in resolution.items:
+                self._custom_emoji.set(item.custom_emoji_id, item)
+                found[item.custom_emoji_id] = item
+            if self.index is not None and resolution.items:
+                await asyncio.to_thread(self.index.put_many, resolution.items)
+            unresolved = resolution.missing
+
+        items = [replace(found[custom_id]) for custom_id in custom_emoji_ids if custom_id in found]
+        return CustomEmojiResolution(items=items, missing=unresolved)
+
+    async def download_emoji(self, item: EmojiItem) -> bytes:
+        return await self.inner.download_emoji(item)
+
+    async def resolve_file_info(self, items: list[EmojiItem], *, concurrency: int = 8) -> None:
+        await self.inner.resolve_file_info(items, concurrency=concurrency)
+
+    def invalidate(self, pack_name: str | None = None) -> None:
+        if pack_name is None:
+            self._packs.clear()
+            self._custom_emoji.clear()
+            return
+        self._packs.pop(self._pack_key(pack_name))
+
+    def invalidate_custom_emoji(self, custom_emoji_ids: list[str]) -> None:
+        for custom_id in custom_emoji_ids:
+            self._custom_emoji.pop(custom_id)
+        if self.index is not None:
+            self.index.forget(custom_emoji_ids)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "pack_hits": self._packs.hits,
+            "pack_misses": self._packs.misses,
+            "custom_emoji_hits": self._custom_emoji.hits,
+            "custom_emoji_misses": self._custom_emoji.misses,
+        }
+
+    async def close(self) -> None:
+        await self.inner.close()
+        if self.index is not None:
+            self.index.close()
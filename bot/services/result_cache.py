@@ -0,0 +1,75 @@
+﻿from __future__ import annotations
+
+from dataclasses import dataclass
+
+from bot.config import Settings
+from bot.services.metrics import cache_lookup
+from bot.services.ttl_cache import TTLCache
+from bot.utils.files import sha256_hex
+
+EXPORT_FORMATS = ("tgs", "json")
+
+
+@dataclass
+class CachedResult:
+    file_ids: list[str]
+    file_name: str
+
+
+def result_fingerprint(asset_hashes: list[str]) -> str:
+    return sha256_hex("\n".join(asset_hashes).encode("utf-8"))
+
+
+class ResultCache:
+    def __init__(self, *, ttl_s: float, max_size: int) -> None:
+        self._entries: TTLCache[tuple[str, str, str], CachedResult] = TTLCache(
+            ttl_s=ttl_s, max_size=max_size
+        )
+        self._latest: TTLCache[tuple[str, str], str] = TTLCache(ttl_s=ttl_s, max_size=max_size)
+
+    def get(
+        self, short_name: str, export_format: str, asset_hashes: list[str]
+    ) -> CachedResult | None:
+        scope = (short_name.lower(), export_format)
+        fingerprint = result_fingerprint(asset_hashes)
+        latest = self._latest.get(scope)
+        if latest is not None and latest != fingerprint:
+            self._drop(scope)
+        result = self._entries.get((*scope, fingerprint))
+        cache_lookup("result", result is not None)
+        return result
+
+    def put(
+        self,
+        short_name: str,
+        export_format: str,
+        asset_hashes: list[str],
+        result: CachedResult,
+    ) -> None:
+        scope = (short_name.lower(), export_format)
+        self._drop(scope)
+        fingerprint = result_fingerprint(asset_hashes)
+        self._latest.set(scope, fingerprint)
+        self._entries.set((*scope, fingerprint), result)
+
+    def invalidate(self, short_name: str, export_format: str | None = None) -> None:
+        for fmt in (export_format,) if export_format else EXPORT_FORMATS:
+            self._drop((short_name.lower(), fmt))
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits": self._entries.hits,
+            "misses": self._entries.misses,
+            "entries": len(self._entries),
+        }
+
+    def _drop(self, scope: tuple[str, str]) -> None:
+        fingerprint = self._latest.pop(scope)
+        if fingerprint is not None:
+            self._entries.pop((*scope, fingerprint))
+
+
+def create_result_cache(settings: Settings) -> ResultCache | None:
+    if settings.result_cache_ttl <= 0:
+        return None
+    return ResultCache(ttl_s=settings.result_cache_ttl, max_size=settings.result_cache_size)
@@ -0,0 +1,231 @@
+﻿from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, TypeVar
+
+from aiogram.exceptions import (
+    TelegramAPIError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+from aiohttp import ClientError, ClientResponseError
+
+from bot.config import Settings
+from bot.services.metrics import CIRCUIT_OPEN, RETRIES, RETRY_BUDGET_EXHAUSTED
+from bot.services.provider_base import CircuitOpenError, FileTooLargeError, ProviderError
+from bot.services.status_updater import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+RETRYABLE_HTTP_STATUSES = {404, 410, 429}
+
+
+@dataclass
+class RetryDecision:
+    retryable: bool
+    upstream_failure: bool = False
+    retry_after_s: float = 0.0
+
+
+def classify(exc: BaseException) -> RetryDecision:
+    if isinstance(exc, TelegramRetryAfter):
+        return RetryDecision(retryable=True, retry_after_s=float(exc.retry_after))
+    if isinstance(exc, (ProviderError, FileTooLargeError)):
+        return RetryDecision(retryable=False)
+    if isinstance(exc, (TelegramServerError, TelegramNetworkError)):
+        return RetryDecision(retryable=True, upstream_failure=True)
+    if isinstance(exc, TelegramAPIError):
+        return RetryDecision(retryable=False)
+    if isinstance(exc, ClientResponseError):
+        if exc.status >= 500:
+            return RetryDecision(retryable=True, upstream_failure=True)
+        return RetryDecision(retryable=exc.status in RETRYABLE_HTTP_STATUSES)
+    if isinstance(exc, (asyncio.TimeoutError, ClientError, OSError)):
+        return RetryDecision(retryable=True, upstream_failure=True)
+    return RetryDecision(retryable=True)
+
+
+class RetryBudget:
+    def __init__(
+        self,
+        *,
+        ratio: float,
+        min_per_s: float,
+        capacity: float,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.ratio = max(0.0, ratio)
+        self._bucket = TokenBucket(rate=min_per_s, capacity=capacity, clock=clock)
+
+    def deposit(self) -> None:
+        self._bucket.add(self.ratio)
+
+    def withdraw(self) -> bool:
+        if self._bucket.delay() > 0:
+            return False
+        self._bucket.take()
+        return True
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        *,
+        failure_threshold: int,
+        reset_timeout_s: float,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout_s = reset_timeout_s
+        self.state = "closed"
+        self.failures = 0
+        self._clock = clock
+        self._opened_at = 0.0
+        self._probing = False
+
+    def allow(self) -> bool:
+        if self.state == "open":
+            if self._clock() - self._opened_at < self.reset_timeout_s:
+                return False
+            self.state = "half_open"
+            self._probing = False
+        if self.state == "half_open":
+            if self._probing:
+                return False
+            self._probing = True
+        return True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self._probing = False
+        if self.state != "closed":
+            logger.info("circuit closed")
+            self.state = "closed"
+            CIRCUIT_OPEN.set(0)
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probing = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                logger.warning("circuit opened", extra={"failures": self.failures})
+            self.state = "open"
+            self._opened_at = self._clock()
+            CIRCUIT_OPEN.set(1)
+
+    def abandon(self) -> None:
+        self._probing = False
+
+
+class RetryPolicy:
+    def __init__(
+        self,
+        *,
+        attempts: int,
+        base_delay_s: float,
+        max_delay_s: float = 10.0,
+        max_retry_after_s: float = 60.0,
+        budget: RetryBudget | None = None,
+        breaker: CircuitBreaker | None = None,
+    ) -> None:
+        self.attempts = max(1, attempts)
+        self.base_delay_s = max(0.0, base_delay_s)
+        self.max_delay_s = max(self.base_delay_s, max_delay_s)
+        self.max_retry_after_s = max_retry_after_s
+        self.budget = budget
+        self.breaker = breaker
+
+    def next_delay(self, previous_s: float) -> float:
+        upper = max(self.base_delay_s, previous_s * 3)
+        return min(self.max_delay_s, random.uniform(self.base_delay_s, upper))
+
+    async def call(
+        self,
+        operation: str,
+        fn: Callable[[], Awaitable[T]],
+        *,
+        timeout_s: float | None = None,
+        attempts: int | None = None,
+    ) -> T:
+        attempts = max(1, attempts or self.attempts)
+        delay_s = self.base_delay_s
+        if self.budget is not None:
+            self.budget.deposit()
+
+        attempt = 0
+        while True:
+            attempt += 1
+            if self.breaker is not None and not self.breaker.allow():
+                raise CircuitOpenError("Telegram временно недоступен, попробуйте позже")
+            try:
+                if timeout_s is None:
+                    result = await fn()
+                else:
+                    result = await asyncio.wait_for(fn(), timeout=timeout_s)
+            except asyncio.CancelledError:
+                if self.breaker is not None:
+                    self.breaker.abandon()
+                raise
+            except Exception as exc:  # noqa: BLE001
+                decision = classify(exc)
+                if self.breaker is not None:
+                    if decision.upstream_failure:
+                        self.breaker.record_failure()
+                    elif isinstance(
+                        exc, (ProviderError, FileTooLargeError, TelegramRetryAfter)
+                    ):
+                        self.breaker.abandon()
+                    else:
+                        self.breaker.record_success()
+                if not decision.retryable or attempt >= attempts:
+                    raise
+                if decision.retry_after_s > self.max_retry_after_s:
+                    raise
+                if self.budget is not None and not self.budget.withdraw():
+                    RETRY_BUDGET_EXHAUSTED.inc(operation=operation)
+                    raise
+
+                delay_s = self.next_delay(delay_s)
+                sleep_s = max(delay_s, decision.retry_after_s)
+                RETRIES.inc(operation=operation)
+                logger.warning(
+                    "%s failed, retrying",
+                    operation,
+                    extra={"attempt": attempt, "sleep_s": round(sleep_s, 3), "error": repr(exc)},
+                )
+                await asyncio.sleep(sleep_s)
+            else:
+                if self.breaker is not None:
+                    self.breaker.record_success()
+                return result
+
+
+def create_retry_policy(settings: Settings) -> RetryPolicy:
+    budget = None
+    if settings.retry_budget_ratio > 0:
+        budget = RetryBudget(
+            ratio=settings.retry_budget_ratio,
+            min_per_s=settings.retry_budget_min_per_s,
+            capacity=max(1.0, settings.retry_budget_min_per_s * 10),
+        )
+    breaker = None
+    if settings.breaker_failure_threshold > 0:
+        breaker = CircuitBreaker(
+            failure_threshold=settings.breaker_failure_threshold,
+            reset_timeout_s=settings.breaker_reset_s,
+        )
+    return RetryPolicy(
+        attempts=settings.download_retries,
+        base_delay_s=settings.retry_backoff_base,
+        max_delay_s=settings.retry_max_delay,
+        max_retry_after_s=settings.retry_after_max,
+        budget=budget,
+        breaker=breaker,
+    )
@@ -0,0 +1,138 @@
+﻿from __future__ import annotations
+
+import asyncio
+import logging
+from collections import Counter, deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Hashable, Iterator
+
+from bot.config import Settings
+
+logger = logging.getLogger(__name__)
+
+PositionCallback = Callable[[int], Awaitable[None]]
+
+
+class SchedulerBusy(Exception):
+    pass
+
+
+@dataclass
+class _Waiter:
+    key: Hashable
+    future: asyncio.Future[None]
+    on_position: PositionCallback | None = None
+    position: int = 0
+
+
+class ExportScheduler:
+    def __init__(self, *, workers: int, max_queued_per_user: int) -> None:
+        self.workers = max(1, workers)
+        self.max_queued_per_user = max(0, max_queued_per_user)
+        self.running = 0
+        self._queues: dict[Hashable, deque[_Waiter]] = {}
+        self._rotation: deque[Hashable] = deque()
+        self._notify_tasks: set[asyncio.Task[None]] = set()
+        self._admitted: Counter[int] = Counter()
+
+    @property
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    @contextmanager
+    def admit(self, user_id: int) -> Iterator[None]:
+        if self._admitted[user_id] >= max(1, self.max_queued_per_user):
+            raise SchedulerBusy("у вас уже есть экспорт в очереди, дождитесь его завершения")
+        self._admitted[user_id] += 1
+        try:
+            yield
+        finally:
+            self._admitted[user_id] -= 1
+            if not self._admitted[user_id]:
+                del self._admitted[user_id]
+
+    async def acquire(self, key: Hashable, on_position: PositionCallback | None = None) -> None:
+        if self.running < self.workers and not self._rotation:
+            self.running += 1
+            return
+
+        waiter = _Waiter(
+            key=key,
+            future=asyncio.get_running_loop().create_future(),
+            on_position=on_position,
+        )
+        self._queues.setdefault(key, deque()).append(waiter)
+        if key not in self._rotation:
+            self._rotation.append(key)
+        self._notify_positions()
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self.release()
+            else:
+                self._discard(waiter)
+            raise
+
+    def release(self) -> None:
+        self.running = max(0, self.running - 1)
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        while self.running < self.workers and self._rotation:
+            key = self._rotation.popleft()
+            queue = self._queues[key]
+            waiter = queue.popleft()
+            if queue:
+                self._rotation.append(key)
+            else:
+                del self._queues[key]
+            if waiter.future.done():
+                continue
+            self.running += 1
+            waiter.future.set_result(None)
+        self._notify_positions()
+
+    def _discard(self, waiter: _Waiter) -> None:
+        queue = self._queues.get(waiter.key)
+        if queue is None or waiter not in queue:
+            return
+        queue.remove(waiter)
+        if not queue:
+            del self._queues[waiter.key]
+            self._rotation.remove(waiter.key)
+        self._notify_positions()
+
+    def _service_order(self) -> list[_Waiter]:
+        order: list[_Waiter] = []
+        queues = {key: list(self._queues[key]) for key in self._rotation}
+        depth = 0
+        while len(order) < self.queued:
+            for key in self._rotation:
+                if depth < len(queues[key]):
+                    order.append(queues[key][depth])
+            depth += 1
+        return order
+
+    def _notify_positions(self) -> None:
+        for position, waiter in enumerate(self._service_order(), start=1):
+            if waiter.position == position or waiter.on_position is None:
+                continue
+            waiter.position = position
+            task = asyncio.create_task(waiter.on_position(position))
+            self._notify_tasks.add(task)
+            task.add_done_callback(self._notify_done)
+
+    def _notify_done(self, task: asyncio.Task[None]) -> None:
+        self._notify_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("queue position update failed", extra={"error": str(task.exception())})
+
+
+def create_scheduler(settings: Settings) -> ExportScheduler:
+    return ExportScheduler(
+        workers=settings.export_workers,
+        max_queued_per_user=settings.export_max_queued_per_user,
+    )
@@ -0,0 +1,110 @@
+﻿from __future__ import annotations
+
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Generic, Hashable, Protocol, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class ProgressListener(Protocol):
+    def __call__(self, text: str, *, force: bool = False) -> Awaitable[None]: ...
+
+
+class _Flight(Generic[T]):
+    def __init__(self) -> None:
+        self.task: asyncio.Task[T] | None = None
+        self.ready: asyncio.Future[T] = asyncio.get_running_loop().create_future()
+        self.value: T | None = None
+        self.listeners: list[ProgressListener] = []
+        self.last_progress: tuple[str, bool] | None = None
+        self.participants = 0
+        self._notify_tasks: set[asyncio.Task[None]] = set()
+
+    def report(self, text: str, *, force: bool = False) -> None:
+        self.last_progress = (text, force)
+        for listener in list(self.listeners):
+            self.notify(listener, text, force)
+
+    def publish(self, value: T) -> None:
+        if self.value is None:
+            self.value = value
+        if not self.ready.done():
+            self.ready.set_result(value)
+
+    def notify(self, listener: ProgressListener, text: str, force: bool) -> None:
+        task = asyncio.create_task(listener(text, force=force))
+        self._notify_tasks.add(task)
+        task.add_done_callback(self._notify_done)
+
+    def _notify_done(self, task: asyncio.Task[None]) -> None:
+        self._notify_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("progress listener failed", extra={"error": str(task.exception())})
+
+
+class SingleFlight(Generic[T]):
+    def __init__(self, *, cleanup: Callable[[T], None] | None = None) -> None:
+        self.cleanup = cleanup
+        self._flights: dict[Hashable, _Flight[T]] = {}
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._flights
+
+    @asynccontextmanager
+    async def join(
+        self,
+        key: Hashable,
+        factory: Callable[[Callable[..., None], Callable[[T], None]], Awaitable[T]],
+        on_progress: ProgressListener | None = None,
+    ) -> AsyncIterator[T]:
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight()
+            self._flights[key] = flight
+            flight.task = asyncio.create_task(factory(flight.report, flight.publish))
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+        elif on_progress is not None and flight.last_progress is not None:
+            text, force = flight.last_progress
+            flight.notify(on_progress, text, force)
+
+        if on_progress is not None:
+            flight.listeners.append(on_progress)
+        flight.participants += 1
+        try:
+            yield await asyncio.shield(flight.ready)
+        finally:
+            if on_progress is not None:
+                flight.listeners.remove(on_progress)
+            flight.participants -= 1
+            if flight.participants == 0:
+                self._finish(flight)
+
+    def _forget(self, key: Hashable, flight: _Flight[T]) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        task = flight.task
+        if task is not None and not task.cancelled() and task.exception() is None:
+            flight.publish(task.result())
+        elif not flight.ready.done():
+            if task is None or task.cancelled():
+                flight.ready.cancel()
+            else:
+                flight.ready.set_exception(task.exception())
+                if flight.participants == 0:
+                    flight.ready.exception()
+        if flight.participants == 0:
+            self._finish(flight)
+
+    def _finish(self, flight: _Flight[T]) -> None:
+        task = flight.task
+        if task is None:
+            return
+        if not task.done():
+            task.cancel()
+            return
+        if self.cleanup is not None and flight.value is not None:
+            self.cleanup(flight.value)
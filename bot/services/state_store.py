@@ -0,0 +1,216 @@
+﻿from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+from bot.config import Settings
+from bot.utils.files import ensure_dir
+
+logger = logging.getLogger(__name__)
+
+PRUNE_INTERVAL_S = 3600.0
+
+DEFAULT_STATE: dict[str, Any] = {
+    "format": "tgs",
+    "awaiting": False,
+    "menu_message_id": None,
+    "menu_chat_id": None,
+}
+
+
+class StateStore(ABC):
+    @abstractmethod
+    def get(self, user_id: int) -> dict[str, Any]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def update(self, user_id: int, **changes: Any) -> dict[str, Any]:
+        raise NotImplementedError
+
+    async def preload(self, user_id: int) -> None:
+        return None
+
+    async def close(self) -> None:
+        return None
+
+
+class MemoryStateStore(StateStore):
+    def __init__(self, *, max_users: int, ttl_s: float) -> None:
+        self.max_users = max(1, max_users)
+        self.ttl_s = ttl_s
+        self._states: OrderedDict[int, tuple[float, dict[str, Any]]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def peek(self, user_id: int) -> dict[str, Any] | None:
+        entry = self._states.get(user_id)
+        if entry is None:
+            return None
+        touched_at, state = entry
+        if self.ttl_s > 0 and time.monotonic() - touched_at > self.ttl_s:
+            del self._states[user_id]
+            return None
+        self._states[user_id] = (time.monotonic(), state)
+        self._states.move_to_end(user_id)
+        return dict(state)
+
+    def put(self, user_id: int, state: dict[str, Any]) -> None:
+        self._states[user_id] = (time.monotonic(), dict(state))
+        self._states.move_to_end(user_id)
+        while len(self._states) > self.max_users:
+            self._states.popitem(last=False)
+
+    def get(self, user_id: int) -> dict[str, Any]:
+        state = self.peek(user_id)
+        return state if state is not None else dict(DEFAULT_STATE)
+
+    def update(self, user_id: int, **changes: Any) -> dict[str, Any]:
+        state = self.get(user_id)
+        state.update(changes)
+        self.put(user_id, state)
+        return dict(state)
+
+
+class SqliteStateStore(StateStore):
+    def __init__(
+        self,
+        path: str | Path,
+        *,
+        max_cached_users: int,
+        ttl_s: float,
+        flush_interval_s: float,
+    ) -> None:
+        self.path = Path(path)
+        self.ttl_s = ttl_s
+        self.flush_interval_s = flush_interval_s
+        self._cache = MemoryStateStore(max_users=max_cached_users, ttl_s=0)
+        self._dirty: dict[int, dict[str, Any]] = {}
+        self._db_lock = threading.Lock()
+        self._flusher: asyncio.Task[None] | None = None
+        self._pruned_at = 0.0
+
+        ensure_dir(self.path.parent)
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS user_state ("
+            "user_id INTEGER PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS user_state_updated_at ON user_state (updated_at)"
+        )
+        self._db.commit()
+
+    def get(self, user_id: int) -> dict[str, Any]:
+        state = self._cache.peek(user_id)
+        if state is not None:
+            return state
+        state = dict(self._dirty.get(user_id) or self._load(user_id) or DEFAULT_STATE)
+        self._cache.put(user_id, state)
+        return state
+
+    def update(self, user_id: int, **changes: Any) -> dict[str, Any]:
+        state = self.get(user_id)
+        state.update(changes)
+        self._cache.put(user_id, state)
+        self._dirty[user_id] = state
+        self._ensure_flusher()
+        return dict(state)
+
+    async def preload(self, user_id: int) -> None:
+        if user_id in self._dirty or self._cache.peek(user_id) is not None:
+            return
+        state = await asyncio.to_thread(self._load, user_id)
+        if user_id in self._dirty or self._cache.peek(user_id) is not None:
+            return
+        self._cache.put(user_id, state or dict(DEFAULT_STATE))
+
+    def _load(self, user_id: int) -> dict[str, Any] | None:
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT data, updated_at FROM user_state WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        data, updated_at = row
+        if self.ttl_s > 0 and time.time() - updated_at > self.ttl_s:
+            return None
+        return {**DEFAULT_STATE, **json.loads(data)}
+
+    def _write(self, batch: dict[int, dict[str, Any]]) -> None:
+        now = time.time()
+        rows = [(user_id, json.dumps(state), now) for user_id, state in batch.items()]
+        with self._db_lock:
+            with self._db:
+                self._db.executemany(
+                    "INSERT INTO user_state (user_id, data, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(user_id) DO UPDATE SET "
+                    "data = excluded.data, updated_at = excluded.updated_at",
+                    rows,
+                )
+
+    def _prune(self) -> int:
+        with self._db_lock:
+            with self._db:
+                cursor = self._db.execute(
+                    "DELETE FROM user_state WHERE updated_at < ?", (time.time() - self.ttl_s,)
+                )
+        return cursor.rowcount
+
+    async def flush(self) -> None:
+        if not self._dirty:
+            return
+        batch, self._dirty = self._dirty, {}
+        try:
+            await asyncio.to_thread(self._write, batch)
+        except sqlite3.Error as exc:
+            logger.warning("state flush failed", extra={"users": len(batch), "error": str(exc)})
+            for user_id, state in batch.items():
+                self._dirty.setdefault(user_id, state)
+        if self.ttl_s > 0 and time.monotonic() - self._pruned_at >= PRUNE_INTERVAL_S:
+            self._pruned_at = time.monotonic()
+            try:
+                removed = await asyncio.to_thread(self._prune)
+            except sqlite3.Error as exc:
+                logger.warning("state prune failed", extra={"error": str(exc)})
+            else:
+                if removed:
+                    logger.info("expired user states pruned", extra={"removed": removed})
+
+    def _ensure_flusher(self) -> None:
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    async def _flush_loop(self) -> None:
+        while self._dirty:
+            await asyncio.sleep(self.flush_interval_s)
+            await self.flush()
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        await self.flush()
+        with self._db_lock:
+            self._db.close()
+
+
+def create_state_store(settings: Settings) -> StateStore:
+    if settings.state_backend == "sqlite":
+        return SqliteStateStore(
+            settings.state_db_path,
+            max_cached_users=settings.state_max_users,
+            ttl_s=settings.state_ttl_s,
+            flush_interval_s=settings.state_flush_interval,
+        )
+    return MemoryStateStore(max_users=settings.state_max_users, ttl_s=settings.state_ttl_s)
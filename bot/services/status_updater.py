@@ -0,0 +1,280 @@
+﻿from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramNetworkError, TelegramRetryAfter
+
+from bot.config import Settings
+from bot.services.metrics import RETRY_AFTER, STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+MessageKey = tuple[int, int]
+
+
+class TokenBucket:
+    def __init__(
+        self, *, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic
+    ) -> None:
+        self.rate = max(rate, 1e-6)
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self._clock = clock
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self) -> float:
+        self._refill()
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self._refill()
+        self.tokens -= 1
+
+    def add(self, tokens: float) -> None:
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + tokens)
+
+    @property
+    def full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+@dataclass
+class _PendingEdit:
+    text: str
+    reply_markup: Any = None
+    force: bool = False
+    waiters: list[asyncio.Future[bool]] = field(default_factory=list)
+
+    def resolve(self, delivered: bool) -> None:
+        for waiter in self.waiters:
+            if not waiter.done():
+                waiter.set_result(delivered)
+        self.waiters.clear()
+
+
+class StatusUpdater:
+    def __init__(
+        self,
+        bot: Bot,
+        *,
+        global_rate: float = 25.0,
+        chat_rate: float = 1.0,
+        chat_burst: float = 3.0,
+        min_interval_s: float = 1.2,
+        force_timeout_s: float = 30.0,
+        max_tracked: int = 10000,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.bot = bot
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.min_interval_s = min_interval_s
+        self.force_timeout_s = force_timeout_s
+        self.max_tracked = max(1, max_tracked)
+        self.sent = 0
+        self.coalesced = 0
+        self.rate_limited = 0
+        self._clock = clock
+        self._global = TokenBucket(rate=global_rate, capacity=global_rate, clock=clock)
+        self._chats: OrderedDict[int, TokenBucket] = OrderedDict()
+        self._blocked_until: dict[int, float] = {}
+        self._pending: dict[MessageKey, _PendingEdit] = {}
+        self._in_flight: set[MessageKey] = set()
+        self._last: OrderedDict[MessageKey, tuple[str, float]] = OrderedDict()
+        self._send_tasks: set[asyncio.Task[None]] = set()
+        self._wakeup = asyncio.Event()
+        self._runner: asyncio.Task[None] | None = None
+
+    async def update(
+        self,
+        chat_id: int,
+        message_id: int,
+        text: str,
+        *,
+        reply_markup: Any = None,
+        force: bool = False,
+    ) -> bool:
+        key = (chat_id, message_id)
+        pending = self._pending.get(key)
+        if pending is None:
+            last = self._last.get(key)
+            if last is not None and last[0] == text and key not in self._in_flight:
+                return True
+            pending = _PendingEdit(text=text, reply_markup=reply_markup, force=force)
+            self._pending[key] = pending
+        else:
+            self.coalesced += 1
+            pending.text = text
+            pending.reply_markup = reply_markup
+            pending.force = pending.force or force
+
+        self._ensure_runner()
+        self._wakeup.set()
+        if not force:
+            return True
+
+        waiter: asyncio.Future[bool] = asyncio.get_running_loop().create_future()
+        pending.waiters.append(waiter)
+        try:
+            return await asyncio.wait_for(asyncio.shield(waiter), self.force_timeout_s)
+        except asyncio.TimeoutError:
+            return False
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "rate_limited": self.rate_limited,
+            "pending": len(self._pending),
+        }
+
+    def _ensure_runner(self) -> None:
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.get_running_loop().create_task(self._run())
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(rate=self.chat_rate, capacity=self.chat_burst, clock=self._clock)
+            self._chats[chat_id] = bucket
+        self._chats.move_to_end(chat_id)
+        while len(self._chats) > self.max_tracked:
+            self._chats.popitem(last=False)
+        return bucket
+
+    def _delay(self, key: MessageKey, pending: _PendingEdit, now: float) -> float:
+        chat_id = key[0]
+        delay = self._blocked_until.get(chat_id, 0.0) - now
+        if not pending.force:
+            last = self._last.get(key)
+            if last is not None:
+                delay = max(delay, last[1] + self.min_interval_s - now)
+        return max(delay, self._chat_bucket(chat_id).delay())
+
+    async def _run(self) -> None:
+        while self._pending or self._in_flight:
+            self._wakeup.clear()
+            now = self._clock()
+            wait: float | None = None
+            ordered = sorted(self._pending.items(), key=lambda entry: not entry[1].force)
+            for key, pending in ordered:
+                if key in self._in_flight:
+                    continue
+                delay = self._delay(key, pending, now)
+                if delay <= 0:
+                    delay = self._global.delay()
+                    if delay <= 0:
+                        self._global.take()
+                        self._chat_bucket(key[0]).take()
+                        del self._pending[key]
+                        self._start_send(key, pending)
+                        continue
+                wait = delay if wait is None else min(wait, delay)
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def _start_send(self, key: MessageKey, pending: _PendingEdit) -> None:
+        self._in_flight.add(key)
+        task = asyncio.get_running_loop().create_task(self._send(key, pending))
+        self._send_tasks.add(task)
+        task.add_done_callback(self._send_tasks.discard)
+
+    async def _send(self, key: MessageKey, pending: _PendingEdit) -> None:
+        chat_id, message_id = key
+        try:
+            with STAGE_SECONDS.time(stage="status_edit"):
+                await self.bot.edit_message_text(
+                    pending.text,
+                    chat_id=chat_id,
+                    message_id=message_id,
+                    reply_markup=pending.reply_markup,
+                )
+        except TelegramRetryAfter as exc:
+            self.rate_limited += 1
+            RETRY_AFTER.inc(method="editMessageText")
+            self._blocked_until[chat_id] = self._clock() + exc.retry_after
+            logger.warning(
+                "status edit rate limited",
+                extra={"chat_id": chat_id, "retry_after": exc.retry_after},
+            )
+            newer = self._pending.get(key)
+            if newer is None:
+                self._pending[key] = pending
+            else:
+                newer.waiters.extend(pending.waiters)
+                newer.force = newer.force or pending.force
+            return
+        except TelegramBadRequest as exc:
+            delivered = "message is not modified" in str(exc)
+            if delivered:
+                self._remember(key, pending.text)
+            pending.resolve(delivered)
+            return
+        except TelegramNetworkError as exc:
+            logger.warning("status edit failed", extra={"chat_id": chat_id, "error": str(exc)})
+            pending.resolve(False)
+            return
+        except asyncio.CancelledError:
+            pending.resolve(False)
+            raise
+        except Exception as exc:  # noqa: BLE001
+            logger.exception(
+                "status edit failed unexpectedly", extra={"chat_id": chat_id, "error": str(exc)}
+            )
+            pending.resolve(False)
+            return
+        finally:
+            self._in_flight.discard(key)
+            self._wakeup.set()
+
+        self.sent += 1
+        self._remember(key, pending.text)
+        pending.resolve(True)
+
+    def _remember(self, key: MessageKey, text: str) -> None:
+        self._last[key] = (text, self._clock())
+        self._last.move_to_end(key)
+        while len(self._last) > self.max_tracked:
+            self._last.popitem(last=False)
+        blocked_until = self._blocked_until.get(key[0])
+        if blocked_until is not None and blocked_until <= self._clock():
+            del self._blocked_until[key[0]]
+
+    async def close(self) -> None:
+        if self._runner is not None:
+            self._runner.cancel()
+            await asyncio.gather(self._runner, return_exceptions=True)
+            self._runner = None
+        if self._send_tasks:
+            await asyncio.gather(*self._send_tasks, return_exceptions=True)
+        for pending in self._pending.values():
+            pending.resolve(False)
+        self._pending.clear()
+
+
+def create_status_updater(settings: Settings, bot: Bot) -> StatusUpdater:
+    return StatusUpdater(
+        bot,
+        global_rate=settings.status_global_rate,
+        chat_rate=settings.status_chat_rate,
+        chat_burst=settings.status_chat_burst,
+        min_interval_s=settings.status_min_interval,
+    )
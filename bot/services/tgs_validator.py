@@ -1,9 +1,23 @@
 ﻿from __future__ import annotations
 
-import gzip
+import codecs
 import json
+import re
+import zlib
 from dataclasses import dataclass
 
+DEFAULT_MAX_DECOMPRESSED_BYTES = 16 * 1024 * 1024
+DECOMPRESS_CHUNK_BYTES = 256 * 1024
+MAX_NESTING_DEPTH = 512
+
+REQUIRED_KEYS = ("w", "h", "fr", "ip", "op", "layers")
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_CONTAINER_TOKEN = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|[\[\]{}]', re.DOTALL)
+_NOT_BRACKET_BYTES = bytes(byte for byte in range(256) if byte not in b"[]{}")
+_OPENERS = {ord("]"): ord("["), ord("}"): ord("{")}
+_decoder = json.JSONDecoder()
+
 
 @dataclass
 class TgsMeta:
@@ -24,29 +38,133 @@ class TgsValidationError(Exception):
     pass
 
 
-def validate_tgs(data: bytes) -> TgsValidationResult:
+def decompress_tgs(data: bytes, max_bytes: int = DEFAULT_MAX_DECOMPRESSED_BYTES) -> bytes:
     if len(data) < 3 or data[:3] != b"\x1f\x8b\x08":
         raise TgsValidationError("неверная сигнатура gzip")
 
+    decompressor = zlib.decompressobj(wbits=31)
+    chunks: list[bytes] = []
+    total = 0
+    pending = data
     try:
-        raw = gzip.decompress(data)
-    except Exception as exc:  # noqa: BLE001
+        while pending and not decompressor.eof:
+            chunk = decompressor.decompress(pending, DECOMPRESS_CHUNK_BYTES)
+            total += len(chunk)
+            if total > max_bytes:
+                raise TgsValidationError("распакованный tgs превышает допустимый размер")
+            chunks.append(chunk)
+            pending = decompressor.unconsumed_tail
+    except zlib.error as exc:
         raise TgsValidationError("ошибка распаковки gzip") from exc
 
+    if not decompressor.eof:
+        raise TgsValidationError("ошибка распаковки gzip")
+    return b"".join(chunks)
+
+
+def _meta_from(values: dict) -> TgsMeta:
+    try:
+        return TgsMeta(
+            w=int(values["w"]),
+            h=int(values["h"]),
+            fr=float(values["fr"]),
+            ip=float(values["ip"]),
+            op=float(values["op"]),
+        )
+    except (TypeError, ValueError, OverflowError) as exc:
+        raise TgsValidationError("некорректные значения ключей Lottie") from exc
+
+
+def _skip_container(text: str, pos: int) -> int:
+    depth = 0
+    for match in _CONTAINER_TOKEN.finditer(text, pos):
+        token = match.group()
+        if token[0] == '"':
+            continue
+        depth += 1 if token in "[{" else -1
+        if depth == 0:
+            return match.end()
+    raise ValueError("unterminated container")
+
+
+def _check_structure(raw: bytes) -> None:
+    if raw.startswith(codecs.BOM_UTF8):
+        raw = raw[len(codecs.BOM_UTF8) :]
+    if b"\\" in raw:
+        raw = raw.replace(b"\\\\", b"").replace(b'\\"', b"")
+    parts = raw.split(b'"')
+    if len(parts) % 2 == 0:
+        raise ValueError("unterminated string")
+    outside = b"".join(parts[::2]).strip(b" \t\n\r")
+    if not outside.startswith(b"{") or not outside.endswith(b"}"):
+        raise ValueError("top level is not a single object")
+
+    stack = bytearray()
+    for token in outside[1:-1].translate(None, _NOT_BRACKET_BYTES):
+        if token in _OPENERS:
+            if not stack or stack.pop() != _OPENERS[token]:
+                raise ValueError("mismatched container")
+        else:
+            stack.append(token)
+            if len(stack) > MAX_NESTING_DEPTH:
+                raise ValueError("containers nested too deeply")
+    if stack:
+        raise ValueError("unterminated container")
+
+
+def _scan_top_level(raw: bytes) -> dict:
+    _check_structure(raw)
+    text = raw.decode("utf-8-sig")
+    found: dict = {}
+    pos = _WHITESPACE.match(text, 0).end()
+    if not text.startswith("{", pos):
+        raise ValueError("top level is not an object")
+    pos += 1
+
+    while True:
+        pos = _WHITESPACE.match(text, pos).end()
+        if text.startswith("}", pos):
+            return found
+        key, pos = _decoder.raw_decode(text, pos)
+        if not isinstance(key, str):
+            raise ValueError("object key is not a string")
+        pos = _WHITESPACE.match(text, pos).end()
+        if not text.startswith(":", pos):
+            raise ValueError("expected ':'")
+        pos = _WHITESPACE.match(text, pos + 1).end()
+
+        if key == "layers":
+            found[key] = None
+            if all(name in found for name in REQUIRED_KEYS):
+                return found
+        if text.startswith(("{", "["), pos):
+            pos = _skip_container(text, pos)
+        else:
+            found[key], pos = _decoder.raw_decode(text, pos)
+            if all(name in found for name in REQUIRED_KEYS):
+                return found
+
+        pos = _WHITESPACE.match(text, pos).end()
+        if text.startswith(",", pos):
+            pos += 1
+        elif not text.startswith("}", pos):
+            raise ValueError("expected ',' or '}'")
+
+
+def validate_tgs(
+    data: bytes,
+    *,
+    strict: bool = False,
+    max_decompressed_bytes: int = DEFAULT_MAX_DECOMPRESSED_BYTES,
+) -> TgsValidationResult:
+    raw = decompress_tgs(data, max_decompressed_bytes)
+
     try:
-        payload = json.loads(raw)
+        payload = json.loads(raw) if strict else _scan_top_level(raw)
     except Exception as exc:  # noqa: BLE001
         raise TgsValidationError("некорректный JSON в tgs") from exc
 
-    required = ["w", "h", "fr", "ip", "op", "layers"]
-    if any(key not in payload for key in required):
+    if not isinstance(payload, dict) or any(key not in payload for key in REQUIRED_KEYS):
         raise TgsValidationError("в tgs отсутствуют обязательные ключи Lottie")
 
-    meta = TgsMeta(
-        w=int(payload["w"]),
-        h=int(payload["h"]),
-        fr=float(payload["fr"]),
-        ip=float(payload["ip"]),
-        op=float(payload["op"]),
-    )
-    return TgsValidationResult(meta=meta, json_bytes=raw)
\ No newline at end of file
+    return TgsValidationResult(meta=_meta_from(payload), json_bytes=raw)
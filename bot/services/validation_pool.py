@@ -0,0 +1,158 @@
+﻿from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from functools import partial
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from bot.config import Settings
+from bot.services.tgs_validator import (
+    DEFAULT_MAX_DECOMPRESSED_BYTES,
+    TgsValidationResult,
+    validate_tgs,
+)
+
+logger = logging.getLogger(__name__)
+
+VALIDATION_MODES = ("process", "thread", "inline")
+
+PendingValidation = tuple[bytes, bool, "asyncio.Future[TgsValidationResult]"]
+
+
+def validate_batch(
+    batch: list[tuple[bytes, bool]], *, strict: bool, max_decompressed_bytes: int
+) -> list[TgsValidationResult | Exception]:
+    results: list[TgsValidationResult | Exception] = []
+    for data, json_output in batch:
+        try:
+            result = validate_tgs(
+                data,
+                strict=strict or json_output,
+                max_decompressed_bytes=max_decompressed_bytes,
+            )
+            if not json_output:
+                result.json_bytes = b""
+            results.append(result)
+        except Exception as exc:  # noqa: BLE001
+            results.append(exc)
+    return results
+
+
+class ValidationPool:
+    def __init__(
+        self,
+        *,
+        mode: str = "inline",
+        workers: int = 0,
+        batch_size: int = 1,
+        batch_delay_s: float = 0.0,
+        strict: bool = False,
+        max_decompressed_bytes: int = DEFAULT_MAX_DECOMPRESSED_BYTES,
+    ) -> None:
+        if mode not in VALIDATION_MODES:
+            raise ValueError(f"unknown validation mode: {mode}")
+        self.mode = mode
+        self.workers = workers or os.cpu_count()
+        self.batch_size = max(1, batch_size)
+        self.batch_delay_s = batch_delay_s
+        self._validate_batch = partial(
+            validate_batch, strict=strict, max_decompressed_bytes=max_decompressed_bytes
+        )
+        self._executor: Executor | None = None
+        if mode == "process":
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        elif mode == "thread":
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="tgs-validate"
+            )
+        self._pending: list[PendingValidation] = []
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self._jobs: set[asyncio.Task[None]] = set()
+
+    async def validate(self, data: bytes, *, json_output: bool = False) -> TgsValidationResult:
+        if self._executor is None:
+            result = self._validate_batch([(data, json_output)])[0]
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future[TgsValidationResult] = loop.create_future()
+        self._pending.append((data, json_output, future))
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.batch_delay_s, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        batch = [entry for entry in batch if not entry[2].done()]
+        if not batch or self._executor is None:
+            return
+
+        job = asyncio.create_task(self._run_batch(batch))
+        self._jobs.add(job)
+        job.add_done_callback(self._jobs.discard)
+
+    async def _run_batch(self, batch: list[PendingValidation]) -> None:
+        payload = [(data, json_output) for data, json_output, _ in batch]
+        results: list[TgsValidationResult | Exception]
+        try:
+            try:
+                results = await asyncio.get_running_loop().run_in_executor(
+                    self._executor, self._validate_batch, payload
+                )
+            except BrokenProcessPool:
+                logger.warning("validation process pool broken, restarting")
+                self._restart_executor()
+                results = await asyncio.to_thread(self._validate_batch, payload)
+        except asyncio.CancelledError:
+            for _, _, future in batch:
+                future.cancel()
+            raise
+        except Exception as exc:  # noqa: BLE001
+            results = [exc] * len(batch)
+        for (_, _, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def _restart_executor(self) -> None:
+        broken = self._executor
+        if broken is None or self.mode != "process":
+            return
+        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    async def close(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        for _, _, future in self._pending:
+            future.cancel()
+        self._pending = []
+        for job in list(self._jobs):
+            job.cancel()
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            await asyncio.to_thread(executor.shutdown, wait=True, cancel_futures=True)
+
+
+def create_validation_pool(settings: Settings) -> ValidationPool:
+    return ValidationPool(
+        mode=settings.validation_executor,
+        workers=settings.validation_workers,
+        batch_size=settings.validation_batch_size,
+        batch_delay_s=settings.validation_batch_delay_ms / 1000,
+        strict=settings.tgs_validation_mode == "strict",
+        max_decompressed_bytes=settings.tgs_max_decompressed_mb * 1024 * 1024,
+    )
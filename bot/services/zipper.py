@@ -1,12 +1,130 @@
 ﻿from __future__ import annotations
 
+import asyncio
+import io
+import os
+import stat
+import time
 from pathlib import Path
-from zipfile import ZIP_DEFLATED, ZipFile
+from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile, ZipInfo
 
+STORED_SUFFIXES = (".tgs",)
+LOCAL_HEADER_SIZE = 30
+CENTRAL_HEADER_SIZE = 46
+END_RECORD_SIZE = 22
 
-def build_zip(zip_path: str | Path, manifest_path: str | Path, assets_dir: str | Path) -> None:
-    assets_dir = Path(assets_dir)
-    with ZipFile(zip_path, mode="w", compression=ZIP_DEFLATED) as zf:
-        zf.write(manifest_path, arcname="manifest.json")
-        for asset in sorted(p for p in assets_dir.iterdir() if p.is_file()):
-            zf.write(asset, arcname=f"assets/{asset.name}")
\ No newline at end of file
+
+def entry_compression(arcname: str) -> int:
+    if arcname.endswith(STORED_SUFFIXES):
+        return ZIP_STORED
+    return ZIP_DEFLATED
+
+
+def entry_size(arcname: str, data: bytes) -> int:
+    size = len(data)
+    if entry_compression(arcname) == ZIP_DEFLATED:
+        size += (size >> 12) + (size >> 14) + 13
+    return LOCAL_HEADER_SIZE + CENTRAL_HEADER_SIZE + 2 * len(arcname.encode("utf-8")) + size
+
+
+class SpillBuffer:
+    def __init__(self, max_memory_bytes: int, spill_path: str | Path) -> None:
+        self.max_memory_bytes = max_memory_bytes
+        self.spill_path = Path(spill_path)
+        self.spilled = False
+        self._fp: io.BytesIO | io.BufferedRandom = io.BytesIO()
+
+    def write(self, data: bytes) -> int:
+        written = self._fp.write(data)
+        if not self.spilled and self._fp.tell() > self.max_memory_bytes:
+            self._spill()
+        return written
+
+    def _spill(self) -> None:
+        position = self._fp.tell()
+        disk = open(self.spill_path, "w+b")
+        disk.write(self._fp.getvalue())
+        disk.seek(position)
+        self._fp = disk
+        self.spilled = True
+
+    def tell(self) -> int:
+        return self._fp.tell()
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        return self._fp.seek(offset, whence)
+
+    def flush(self) -> None:
+        self._fp.flush()
+
+    def getvalue(self) -> bytes:
+        if self.spilled:
+            return self.spill_path.read_bytes()
+        return self._fp.getvalue()
+
+    def close(self) -> None:
+        self._fp.close()
+
+
+class ArchiveWriter:
+    def __init__(
+        self,
+        spill_path: str | Path,
+        *,
+        max_memory_bytes: int,
+        deflate_level: int | None = None,
+    ) -> None:
+        self._buffer = SpillBuffer(max_memory_bytes, spill_path)
+        self._zip = ZipFile(self._buffer, mode="w", compression=ZIP_DEFLATED)
+        self.deflate_level = deflate_level
+        self.closed = False
+        self.entries = 0
+        self._central_bytes = 0
+
+    def __enter__(self) -> ArchiveWriter:
+        return self
+
+    def __exit__(self, exc_type: type[BaseException] | None, *exc_info: object) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+    def add(self, arcname: str, data: bytes) -> None:
+        info = ZipInfo(arcname, date_time=time.localtime()[:6])
+        info.compress_type = entry_compression(arcname)
+        info.external_attr = (stat.S_IFREG | 0o644) << 16
+        self._zip.writestr(info, data, compresslevel=self.deflate_level)
+        self.entries += 1
+        self._central_bytes += CENTRAL_HEADER_SIZE + len(arcname.encode("utf-8"))
+
+    async def add_async(self, arcname: str, data: bytes, *, offload_bytes: int) -> None:
+        if entry_compression(arcname) == ZIP_DEFLATED and len(data) >= offload_bytes:
+            await asyncio.to_thread(self.add, arcname, data)
+        else:
+            self.add(arcname, data)
+
+    def close(self) -> None:
+        if not self.closed:
+            self._zip.close()
+            self._buffer.flush()
+            if self._buffer.spilled:
+                self._buffer.close()
+            self.closed = True
+
+    @property
+    def size(self) -> int:
+        return self._buffer.tell() + self._central_bytes + END_RECORD_SIZE
+
+    @property
+    def path(self) -> Path | None:
+        return self._buffer.spill_path if self._buffer.spilled else None
+
+    def getvalue(self) -> bytes:
+        return self._buffer.getvalue()
+
+    def discard(self) -> None:
+        self.close()
+        self._buffer.close()
+        if self._buffer.spilled:
+            self._buffer.spill_path.unlink(missing_ok=True)
@@ -0,0 +1,146 @@
+﻿from __future__ import annotations
+
+import asyncio
+import logging
+import signal
+from contextlib import suppress
+from typing import Any
+
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from bot.config import Settings
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class BoundedRequestHandler(SimpleRequestHandler):
+    def __init__(
+        self,
+        dispatcher: Dispatcher,
+        bot: Bot,
+        *,
+        secret_token: str | None,
+        concurrency: int,
+        max_pending: int,
+        drain_timeout_s: float,
+        **data: Any,
+    ) -> None:
+        super().__init__(
+            dispatcher, bot, handle_in_background=True, secret_token=secret_token or None, **data
+        )
+        self.max_pending = max(1, max_pending)
+        self.drain_timeout_s = max(0.0, drain_timeout_s)
+        self.closing = False
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+        self._tasks: set[asyncio.Task[None]] = set()
+
+    @property
+    def pending(self) -> int:
+        return len(self._tasks)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if not self.verify_secret(request.headers.get(SECRET_HEADER, ""), self.bot):
+            return web.Response(body="Unauthorized", status=401)
+        if self.closing or len(self._tasks) >= self.max_pending:
+            return web.Response(status=503, headers={"Retry-After": "1"})
+
+        update = await request.json(loads=self.bot.session.json_loads)
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.json_response({}, dumps=self.bot.session.json_dumps)
+
+    __call__ = handle
+
+    async def _process(self, update: dict[str, Any]) -> None:
+        await self._semaphore.acquire()
+        released = False
+
+        def release_slot() -> None:
+            nonlocal released
+            if not released:
+                released = True
+                self._semaphore.release()
+
+        try:
+            result = await self.dispatcher.feed_raw_update(
+                bot=self.bot, update=update, release_slot=release_slot, **self.data
+            )
+            if isinstance(result, TelegramMethod):
+                await self.dispatcher.silent_call_request(bot=self.bot, result=result)
+        except Exception:  # noqa: BLE001
+            logger.exception("webhook update failed", extra={"update_id": update.get("update_id")})
+        finally:
+            release_slot()
+
+    async def close(self) -> None:
+        self.closing = True
+        if not self._tasks:
+            return
+        logger.info("draining webhook updates", extra={"pending": len(self._tasks)})
+        _, unfinished = await asyncio.wait(set(self._tasks), timeout=self.drain_timeout_s or None)
+        if unfinished:
+            logger.warning("drain timeout, cancelling updates", extra={"cancelled": len(unfinished)})
+            for task in unfinished:
+                task.cancel()
+            await asyncio.gather(*unfinished, return_exceptions=True)
+
+
+def create_webhook_app(dp: Dispatcher, bot: Bot, settings: Settings) -> web.Application:
+    app = web.Application()
+    handler = BoundedRequestHandler(
+        dp,
+        bot,
+        secret_token=settings.webhook_secret,
+        concurrency=settings.webhook_concurrency,
+        max_pending=settings.webhook_max_pending,
+        drain_timeout_s=settings.webhook_drain_timeout,
+        config=settings,
+    )
+
+    async def handle_health(_: web.Request) -> web.Response:
+        return web.Response(text="ok")
+
+    handler.register(app, path=settings.webhook_path)
+    app.router.add_get("/healthz", handle_health)
+    app["webhook_handler"] = handler
+    setup_application(app, dp, bot=bot, config=settings)
+    return app
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot, settings: Settings) -> None:
+    app = create_webhook_app(dp, bot, settings)
+    runner = web.AppRunner(app, access_log=None)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        with suppress(NotImplementedError):
+            loop.add_signal_handler(sig, stop.set)
+
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, settings.webhook_host, settings.webhook_port).start()
+        if settings.webhook_url:
+            await bot.set_webhook(
+                url=settings.webhook_url,
+                secret_token=settings.webhook_secret or None,
+                max_connections=settings.webhook_max_connections,
+                allowed_updates=dp.resolve_used_update_types(),
+            )
+        logger.info(
+            "webhook server started",
+            extra={
+                "host": settings.webhook_host,
+                "port": settings.webhook_port,
+                "path": settings.webhook_path,
+            },
+        )
+        await stop.wait()
+    finally:
+        await runner.cleanup()
@@ -0,0 +1,216 @@
+﻿from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import signal
+import socket
+import sys
+from contextlib import suppress
+from typing import Any, Awaitable, Callable
+
+if __package__ is None or __package__ == "":
+    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from aiogram import Bot
+
+from bot.config import load_settings
+from bot.handlers.export_link import run_export_job
+from bot.handlers.ui import build_back_kb, with_signature
+from bot.logging_setup import setup_logging
+from bot.services.asset_cache import create_asset_cache
+from bot.services.checkpoint import create_checkpoint_store, prune_checkpoints
+from bot.services.exporter import ExportArtifact
+from bot.services.http_session import create_bot_session
+from bot.services.job_queue import JobQueue, QueuedJob, create_job_queue
+from bot.services.metrics import IN_FLIGHT, QUEUE_DEPTH, configure_metrics, start_metrics_server
+from bot.services.provider_base import create_provider
+from bot.services.result_cache import create_result_cache
+from bot.services.scheduler import create_scheduler
+from bot.services.single_flight import SingleFlight
+from bot.services.status_updater import StatusUpdater, create_status_updater
+from bot.services.validation_pool import create_validation_pool
+
+logger = logging.getLogger(__name__)
+
+JobRunner = Callable[[dict[str, Any]], Awaitable[None]]
+
+
+class ExportWorker:
+    def __init__(
+        self,
+        queue: JobQueue,
+        run_job: JobRunner,
+        *,
+        worker_id: str,
+        concurrency: int,
+        lease_s: float,
+        poll_interval_s: float,
+        max_attempts: int,
+        on_give_up: JobRunner | None = None,
+    ) -> None:
+        self.queue = queue
+        self.run_job = run_job
+        self.worker_id = worker_id
+        self.concurrency = max(1, concurrency)
+        self.lease_s = max(1.0, lease_s)
+        self.poll_interval_s = max(0.05, poll_interval_s)
+        self.max_attempts = max(1, max_attempts)
+        self.on_give_up = on_give_up
+        self._tasks: set[asyncio.Task[None]] = set()
+
+    @property
+    def running(self) -> int:
+        return len(self._tasks)
+
+    async def run(self, stop: asyncio.Event) -> None:
+        slots = asyncio.Semaphore(self.concurrency)
+        logger.info("worker started", extra={"worker_id": self.worker_id, "slots": self.concurrency})
+        while not stop.is_set():
+            await slots.acquire()
+            if stop.is_set():
+                slots.release()
+                break
+            try:
+                job = await self.queue.claim(self.worker_id, self.lease_s)
+            except Exception:  # noqa: BLE001
+                logger.exception("job claim failed")
+                job = None
+            if job is None:
+                slots.release()
+                with suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(stop.wait(), timeout=self.poll_interval_s)
+                continue
+
+            task = asyncio.create_task(self._execute(job))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            task.add_done_callback(lambda _: slots.release())
+
+        if self._tasks:
+            logger.info("waiting for running jobs", extra={"jobs": len(self._tasks)})
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _execute(self, job: QueuedJob) -> None:
+        if job.attempts > self.max_attempts:
+            logger.warning("job gave up", extra={"job_id": job.id, "attempts": job.attempts})
+            await self.queue.fail(job.id, self.worker_id, "too many attempts")
+            if self.on_give_up is not None:
+                with suppress(Exception):
+                    await self.on_give_up(job.payload)
+            return
+
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        try:
+            await self.run_job(job.payload)
+        except Exception as exc:  # noqa: BLE001
+            logger.exception("job failed", extra={"job_id": job.id})
+            await self.queue.fail(job.id, self.worker_id, str(exc) or type(exc).__name__)
+        else:
+            await self.queue.complete(job.id, self.worker_id)
+            logger.info("job done", extra={"job_id": job.id, "attempts": job.attempts})
+        finally:
+            heartbeat.cancel()
+            await asyncio.gather(heartbeat, return_exceptions=True)
+
+    async def _heartbeat(self, job: QueuedJob) -> None:
+        while True:
+            await asyncio.sleep(self.lease_s / 3)
+            if not await self.queue.heartbeat(job.id, self.worker_id, self.lease_s):
+                logger.warning("job lease lost", extra={"job_id": job.id})
+                return
+
+
+async def report_give_up(updater: StatusUpdater, payload: dict[str, Any]) -> None:
+    await updater.update(
+        payload["status_chat_id"],
+        payload["status_message_id"],
+        with_signature("экспорт прерван: не удалось завершить задачу, попробуйте ещё раз"),
+        reply_markup=build_back_kb(),
+        force=True,
+    )
+
+
+async def main() -> None:
+    settings = load_settings()
+    setup_logging(settings.log_level)
+    if settings.export_backend != "queue":
+        logger.info("worker not needed", extra={"export_backend": settings.export_backend})
+        return
+
+    session = create_bot_session(settings)
+    bot = Bot(token=settings.bot_token, session=session)
+    provider = create_provider(settings, bot)
+    status_updater = create_status_updater(settings, bot)
+    asset_cache = create_asset_cache(settings)
+    result_cache = create_result_cache(settings)
+    validator = create_validation_pool(settings)
+    queue = create_job_queue(settings)
+    checkpoints = create_checkpoint_store(settings)
+    scheduler = create_scheduler(settings)
+    export_flights: SingleFlight[ExportArtifact] = SingleFlight(cleanup=ExportArtifact.cleanup)
+
+    async def run_job(payload: dict[str, Any]) -> None:
+        await run_export_job(
+            bot,
+            payload,
+            config=settings,
+            provider=provider,
+            asset_cache=asset_cache,
+            result_cache=result_cache,
+            validator=validator,
+            scheduler=scheduler,
+            export_flights=export_flights,
+            status_updater=status_updater,
+            checkpoints=checkpoints,
+        )
+
+    async def give_up(payload: dict[str, Any]) -> None:
+        await report_give_up(status_updater, payload)
+
+    worker = ExportWorker(
+        queue,
+        run_job,
+        worker_id=f"{socket.gethostname()}:{os.getpid()}",
+        concurrency=settings.export_workers,
+        lease_s=settings.job_lease_s,
+        poll_interval_s=settings.job_poll_interval,
+        max_attempts=settings.job_max_attempts,
+        on_give_up=give_up,
+    )
+
+    metrics_runner = None
+    if configure_metrics(settings):
+        QUEUE_DEPTH.set_function(queue.depth)
+        IN_FLIGHT.set_function(lambda: worker.running)
+        metrics_runner = await start_metrics_server(settings.metrics_host, settings.metrics_port)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        with suppress(NotImplementedError):
+            loop.add_signal_handler(sig, stop.set)
+
+    pruner = None
+    if checkpoints is not None:
+        pruner = asyncio.create_task(
+            prune_checkpoints(checkpoints, interval_s=settings.checkpoint_prune_interval_s)
+        )
+
+    try:
+        await worker.run(stop)
+    finally:
+        if pruner is not None:
+            pruner.cancel()
+        await provider.close()
+        await validator.close()
+        await status_updater.close()
+        await queue.close()
+        await bot.session.close()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        logger.info("worker stopped", extra=session.stats.snapshot())
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
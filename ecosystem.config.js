@@ -5,6 +5,20 @@
       script: "bot/main.py",
       interpreter: "python",
       cwd: __dirname,
+      kill_timeout: 65000,
+      env: {
+        PYTHONUNBUFFERED: "1"
+      }
+    },
+    {
+      name: "emoji-export-worker",
+      script: "bot/worker.py",
+      interpreter: "python",
+      cwd: __dirname,
+      instances: 1,
+      autorestart: true,
+      stop_exit_codes: [0],
+      kill_timeout: 65000,
       env: {
         PYTHONUNBUFFERED: "1"
       }